@@ -0,0 +1,74 @@
+"""
+Benchmark the time taken to import `pecanpy` in a fresh interpreter.
+
+Importing the package should not import any submodule or heavy dependency;
+these are loaded lazily on first attribute access. Run from the repository
+root...
+
+    $ python benchmarks/import_time.py --max-seconds 0.05
+
+...which exits with a non-zero status if the bare import is too slow or
+eagerly imports a heavy dependency.
+
+@author : davidrpugh
+
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ["numpy", "pandas", "sqlalchemy", "pecanpy.surveys_api"]
+
+STATEMENTS = {"import pecanpy": "import pecanpy",
+              "first reader access": "import pecanpy; pecanpy.read_gas_ert_query"}
+
+TEMPLATE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(name for name in {heavy_modules!r} if name in sys.modules))
+"""
+
+
+def time_statement(statement: str, repeat: int):
+    """Run `statement` in `repeat` fresh interpreters, returning timings and eager imports."""
+    timings, loaded = [], set()
+    for _ in range(repeat):
+        code = TEMPLATE.format(statement=statement, heavy_modules=HEAVY_MODULES)
+        output = subprocess.run([sys.executable, "-c", code], check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        elapsed, modules = output.splitlines()
+        timings.append(float(elapsed))
+        loaded.update(filter(None, modules.split(",")))
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="fail if the median bare import takes longer than this")
+    args = parser.parse_args()
+
+    status = 0
+    for label, statement in STATEMENTS.items():
+        timings, loaded = time_statement(statement, args.repeat)
+        median = statistics.median(timings)
+        print("{:<20} median {:8.2f} ms  min {:8.2f} ms  heavy modules: {}".format(
+            label, 1e3 * median, 1e3 * min(timings), ", ".join(sorted(loaded)) or "none"))
+        if statement == "import pecanpy":
+            if loaded:
+                print("FAIL: bare import loaded {}".format(", ".join(sorted(loaded))))
+                status = 1
+            if args.max_seconds is not None and median > args.max_seconds:
+                print("FAIL: bare import slower than {} s".format(args.max_seconds))
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
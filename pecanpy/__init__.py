@@ -1,10 +1,88 @@
 """
 Objects imported here will live in the `pecanpy` namespace.
 
+Submodules (and therefore heavy dependencies such as pandas and SQLAlchemy)
+are only imported when one of their objects is first accessed, which keeps
+`import pecanpy` fast in short-lived worker processes.
+
 @author : davidrpugh
 
 """
-from . gas_water_api import *
-from . electricity_egauge_api import read_electricity_egauge_query
-from . surveys_api import *
-from . utils import *
+import importlib
+
+
+# maps each object in the `pecanpy` namespace to the submodule defining it
+_OBJECTS = {
+    "read_gas_ert_query": "gas_water_api",
+    "read_electric_vehicles_table": "gas_water_api",
+    "read_water_ert_query": "gas_water_api",
+    "read_water_capstone_query": "gas_water_api",
+    "read_electricity_egauge_query": "electricity_egauge_api",
+    "read_electricity_egauge_daily_summary": "electricity_egauge_api",
+    "read_electricity_egauge_queries": "parallel",
+    "read_electricity_egauge_dask": "dask_api",
+    "read_gas_ert_dask": "dask_api",
+    "read_water_ert_dask": "dask_api",
+    "read_household_utilities_query": "household_api",
+    "read_sampled_dataids": "sampling",
+    "read_electricity_egauge_sample": "sampling",
+    "read_gas_ert_sample": "sampling",
+    "read_water_ert_sample": "sampling",
+    "connect_parquet": "backends",
+    "read_query": "backends",
+    "read_table": "backends",
+    "charging_sessions": "charging",
+    "read_charging_sessions": "charging",
+    "RequestCoalescer": "coalescing",
+    "QueryDiagnostics": "diagnostics",
+    "diagnose_query": "diagnostics",
+    "diagnose_electricity_egauge_query": "diagnostics",
+    "diagnose_gas_ert_query": "diagnostics",
+    "diagnose_water_ert_query": "diagnostics",
+    "diagnose_water_capstone_query": "diagnostics",
+    "AdaptiveWindowPlanner": "planning",
+    "estimate_query_rows": "planning",
+    "read_electricity_egauge_query_adaptive": "planning",
+    "read_gas_ert_query_adaptive": "planning",
+    "read_water_ert_query_adaptive": "planning",
+    "QueryResult": "results",
+    "build_rollup_pyramid": "pyramid",
+    "read_rollup_pyramid": "pyramid",
+    "write_household_store": "store",
+    "read_household_store": "store",
+    "list_household_store": "store",
+    "read_survey_2011_all_participants_table": "surveys_api",
+    "read_survey_2012_all_participants_table": "surveys_api",
+    "read_survey_2012_field_descriptions_table": "surveys_api",
+    "read_survey_2013_all_participants_table": "surveys_api",
+    "read_survey_2013_field_descriptions_table": "surveys_api",
+    "read_survey_2014_all_participants_table": "surveys_api",
+    "read_survey_2014_field_descriptions_table": "surveys_api",
+    "read_survey_panel": "surveys_api",
+    "read_sql_query": "utils",
+    "create_engine": "utils",
+    "read_metadata_table": "utils",
+}
+
+_SUBMODULES = {"backends", "charging", "coalescing", "dask_api", "diagnostics",
+               "electricity_egauge_api", "gas_water_api", "household_api", "parallel",
+               "planning", "pyramid", "results", "sampling", "store", "streaming",
+               "surveys_api", "utils"}
+
+__all__ = sorted(_OBJECTS)
+
+
+def __getattr__(name: str):
+    if name in _OBJECTS:
+        module = importlib.import_module("." + _OBJECTS[name], __name__)
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value  # subsequent lookups bypass __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_OBJECTS) | _SUBMODULES)
@@ -0,0 +1,195 @@
+"""
+Functions for executing the queries generated by the readers against either a
+PostgreSQL database (via SQLAlchemy) or a local directory of Parquet files (via
+DuckDB). Local Parquet extracts must use the same table names and schemas as
+the Pecan Street Dataport.
+
+@author : davidrpugh
+
+"""
+import glob
+import os
+from typing import Generator, List, Union
+
+import pandas as pd
+from pandas.api import types
+import sqlalchemy
+
+
+def connect_parquet(directory: str,
+                    schema: str = "public",
+                    database: str = ":memory:"):
+    """
+    Connect DuckDB to a directory of Parquet files laid out like the Dataport.
+
+    Each file "<directory>/<table>.parquet", or each sub-directory
+    "<directory>/<table>/" containing Parquet files, is exposed as the view
+    `<schema>.<table>`. The returned connection may be passed as the `con`
+    argument of any reader.
+
+    Parameters
+    ----------
+    directory : `str`
+        Directory containing the Parquet files.
+    schema : `str`, default: "public"
+        Name of the schema in which to create the views. Pass the same name as
+        the `schema` argument of the readers.
+    database : `str`, default: ":memory:"
+        DuckDB database in which to create the views.
+
+    Returns
+    -------
+    con: `duckdb.DuckDBPyConnection`
+
+        Connection to the DuckDB database.
+
+    Notes
+    -----
+    Requires `duckdb`.
+
+    """
+    import duckdb
+
+    con = duckdb.connect(database)
+    con.execute("SET TimeZone='UTC';")
+    con.execute("CREATE SCHEMA IF NOT EXISTS {};".format(schema))
+    for path in sorted(os.listdir(directory)):
+        table, extension = os.path.splitext(path)
+        full_path = os.path.join(directory, path)
+        if os.path.isdir(full_path):
+            files = os.path.join(full_path, "**", "*.parquet")
+            if not glob.glob(files, recursive=True):
+                continue
+        elif extension == ".parquet":
+            files = full_path
+        else:
+            continue
+        template = """CREATE OR REPLACE VIEW {schema}.{table} AS
+                      SELECT * FROM read_parquet('{files}');"""
+        con.execute(template.format(schema=schema, table=table, files=files))
+    return con
+
+
+def read_query(con: sqlalchemy.engine.Connectable,
+               query: str,
+               index_col: Union[str, List[str], None] = None,
+               parse_dates: Union[list, dict, None] = None,
+               params=None,
+               chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
+    """
+    Execute a query against either backend, returning the results in a
+    `pandas.DataFrame` (or a generator of them if `chunksize` is used). Behaves
+    like `pandas.read_sql_query`, except that chunks are fetched from a
+    server-side cursor, so that only one chunk at a time is held in memory,
+    and that the query is only executed once the first chunk is requested.
+
+    """
+    if not _is_duckdb(con):
+        if chunksize is not None:
+            return _read_sql_chunks(con, query, index_col, parse_dates, params, chunksize)
+        return pd.read_sql_query(query, con, index_col=index_col,
+                                 parse_dates=parse_dates, params=params)
+
+    if chunksize is not None:
+        return _read_duckdb_chunks(con, query, params, index_col, parse_dates, chunksize)
+    cursor = _execute_duckdb(con, query, params)
+    try:
+        return _format_frame(cursor.df(), index_col, parse_dates)
+    finally:
+        cursor.close()
+
+
+def read_table(con: sqlalchemy.engine.Connectable,
+               table: str,
+               schema: str,
+               index_col: Union[str, List[str], None] = None,
+               parse_dates: Union[list, dict, None] = None) -> pd.DataFrame:
+    """
+    Read a whole table/view from either backend into a `pandas.DataFrame`.
+    Behaves like `pandas.read_sql_table`.
+
+    """
+    if not _is_duckdb(con):
+        return pd.read_sql_table(table, con, schema, index_col=index_col,
+                                 parse_dates=parse_dates)
+
+    query = "SELECT * FROM {}.{};".format(schema, table)
+    return read_query(con, query, index_col=index_col, parse_dates=parse_dates)
+
+
+def _is_duckdb(con) -> bool:
+    return type(con).__module__.lstrip('_').startswith("duckdb")
+
+
+def _read_sql_chunks(con: sqlalchemy.engine.Connectable,
+                     query: str,
+                     index_col,
+                     parse_dates,
+                     params,
+                     chunksize: int) -> Generator:
+    """
+    Stream the result of a query through SQLAlchemy. Without `stream_results`,
+    drivers such as psycopg2 transfer the whole result to the client before
+    the first chunk is returned.
+
+    """
+    if isinstance(con, sqlalchemy.engine.Engine):
+        with con.connect() as connection:
+            yield from _read_sql_chunks(connection, query, index_col, parse_dates,
+                                        params, chunksize)
+        return
+    stream_results = con.get_execution_options().get("stream_results", False)
+    connection = con.execution_options(stream_results=True)
+    try:
+        yield from pd.read_sql_query(query, connection, index_col=index_col,
+                                     parse_dates=parse_dates, params=params,
+                                     chunksize=chunksize)
+    finally:
+        connection.execution_options(stream_results=stream_results)
+
+
+def _execute_duckdb(con, query: str, params=None):
+    # each query gets its own cursor, as results held on the connection itself
+    # are discarded by the next query executed on it
+    cursor = con.cursor()
+    if params is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query, params)
+    return cursor
+
+
+def _read_duckdb_chunks(con, query: str, params, index_col, parse_dates,
+                        chunksize: int) -> Generator:
+    """Stream the result of a DuckDB query as Arrow record batches."""
+    import pyarrow as pa
+
+    cursor = _execute_duckdb(con, query, params)
+    try:
+        reader = cursor.fetch_record_batch(chunksize)
+        # DECIMAL columns are returned as float64, as `cursor.df()` does
+        schema = pa.schema([field.with_type(pa.float64()) if pa.types.is_decimal(field.type) else field
+                            for field in reader.schema])
+        for batch in reader:
+            table = pa.Table.from_batches([batch]).cast(schema)
+            yield _format_frame(table.to_pandas(), index_col, parse_dates)
+    finally:
+        cursor.close()
+
+
+def _format_frame(df: pd.DataFrame, index_col, parse_dates) -> pd.DataFrame:
+    """Parse dates and set the index in the same way as `pandas.read_sql_query`."""
+    if isinstance(parse_dates, dict):
+        for column, kwargs in parse_dates.items():
+            kwargs = kwargs if isinstance(kwargs, dict) else {"format": kwargs}
+            df[column] = pd.to_datetime(df[column], **kwargs)
+    elif parse_dates is not None:
+        for column in [parse_dates] if isinstance(parse_dates, str) else parse_dates:
+            df[column] = pd.to_datetime(df[column])
+    for column in df:
+        # DuckDB returns microsecond resolution timestamps, SQLAlchemy nanosecond
+        if types.is_datetime64_any_dtype(df[column]) and hasattr(df[column].dt, "as_unit"):
+            df[column] = df[column].dt.as_unit("ns")
+    if index_col is not None:
+        df.set_index(index_col, inplace=True)
+    return df
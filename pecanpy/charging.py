@@ -0,0 +1,226 @@
+"""
+Functions for extracting electric vehicle charging sessions from the car
+circuits of the electricity egauge data. A session is a run of consecutive
+readings above a power threshold; runs are found with vectorized operations on
+each chunk and sessions spanning chunk boundaries are carried over to the next
+chunk, so whole cohorts can be processed in a single streamed query.
+
+@author : davidrpugh
+
+"""
+from typing import Generator, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+import sqlalchemy
+
+from . backends import read_query
+from . electricity_egauge_api import _egauge_table_kwargs
+from . gas_water_api import read_electric_vehicles_table
+
+
+SESSION_COLUMNS = ["dataid", "start", "end", "kwh", "peak_kw"]
+
+
+def charging_sessions(chunks: Iterable[pd.DataFrame],
+                      column: str = "car1",
+                      threshold: float = 1.0,
+                      freq: str = 'T',
+                      max_gap: Union[str, None] = None) -> Generator:
+    """
+    Extract charging sessions from chunks of a household's electricity egauge
+    data (e.g., as returned by `read_electricity_egauge_query` with
+    `chunksize`).
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of electricity egauge data, indexed by timestamp.
+    column : `str`, default: "car1"
+        The car circuit (in kW).
+    threshold : `float`, default: 1.0
+        Readings above this power (in kW) are considered to be charging.
+    freq : `str`, default: 'T'
+        Sampling frequency of the data. Must be one of 'T' (minutes), "15T"
+        (15-minute), or 'H' (hourly).
+    max_gap : `Union[str, None]`, default: `None`
+        Readings further apart than this are never part of the same session.
+        Defaults to `freq`, so that missing readings end a session.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Completed sessions, as `pandas.DataFrame` chunks with "start", "end",
+        "kwh" and "peak_kw" columns. The end of a session is the end of its
+        last reading above `threshold`.
+
+    """
+    state = None
+    for chunk in chunks:
+        sessions, state = _detect_sessions(chunk.index, chunk[column].to_numpy(),
+                                           state, threshold, freq, max_gap)
+        if len(sessions) > 0:
+            yield sessions
+    if state is not None:
+        yield _session_frame([state], freq)
+
+
+def read_charging_sessions(con: sqlalchemy.engine.Connectable,
+                           schema: str,
+                           start_time: Union[pd.Timestamp, str],
+                           end_time: Union[pd.Timestamp, str],
+                           dataids: Union[List[int], None] = None,
+                           column: str = "car1",
+                           threshold: float = 1.0,
+                           freq: str = 'T',
+                           tz: str = "US/Central",
+                           max_gap: Union[str, None] = None,
+                           chunksize: int = 100000) -> pd.DataFrame:
+    """
+    Read the charging sessions of electric vehicle households from a database
+    into a `pandas.DataFrame`.
+
+    The car circuit of all households is read with a single query ordered by
+    dataid and time and streamed from a server-side cursor (see
+    `read_query`), so memory use is bounded by `chunksize` rather than by the
+    size of the cohort.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the `electric_vehicles` and electricity
+        egauge tables/views.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+    dataids : `Union[List[int], None]`, default: `None`
+        Households to read. Defaults to all households in the
+        `electric_vehicles` table.
+    column : `str`, default: "car1"
+        The car circuit (in kW).
+    threshold : `float`, default: 1.0
+        Readings above this power (in kW) are considered to be charging.
+    freq : `str`, default: 'T'
+        The sampling frequency of the electricity egauge data to read. Must be
+        one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+    max_gap : `Union[str, None]`, default: `None`
+        Readings further apart than this are never part of the same session.
+        Defaults to `freq`.
+    chunksize : `int`, default: 100000
+        Number of rows fetched at a time.
+
+    Returns
+    -------
+    sessions_df: `pandas.DataFrame`
+
+        One row per session with "dataid", "start", "end", "kwh" and
+        "peak_kw" columns.
+
+    Raises
+    ------
+    ValueError
+        If `freq` is not one of 'T', "15T", or 'H'.
+
+    """
+    kwargs = _egauge_table_kwargs(freq)
+    if dataids is None:
+        dataids = read_electric_vehicles_table(con, schema).index.unique().tolist()
+    if not dataids:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+
+    local_minute = kwargs["local_minute"]
+    template = """SELECT dataid, {local_minute}, {column} FROM {schema}.{table}
+                  WHERE dataid IN ({dataids}) AND
+                    {local_minute} >= '{start_time}' AND
+                    {local_minute} < '{end_time}'
+                  ORDER BY dataid, {local_minute} ASC;"""
+    query = template.format(column=column, schema=schema,
+                            dataids=", ".join(str(dataid) for dataid in dataids),
+                            start_time=start_time, end_time=end_time, **kwargs)
+    chunks = read_query(con, query, parse_dates={local_minute: {"utc": True}},
+                        chunksize=chunksize)
+
+    results = []
+    current_dataid, state = None, None
+    for chunk in chunks:
+        chunk_dataids = chunk["dataid"].to_numpy()
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(chunk_dataids)) + 1, [len(chunk)]])
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
+            dataid = chunk_dataids[lower]
+            if dataid != current_dataid:
+                if state is not None:  # a household's data ended while charging
+                    results.append(_session_frame([state], freq).assign(dataid=current_dataid))
+                current_dataid, state = dataid, None
+            household = chunk.iloc[lower:upper]
+            times = pd.DatetimeIndex(household[local_minute]).tz_convert(tz)
+            sessions, state = _detect_sessions(times, household[column].to_numpy(),
+                                               state, threshold, freq, max_gap)
+            results.append(sessions.assign(dataid=dataid))
+    if state is not None:
+        results.append(_session_frame([state], freq).assign(dataid=current_dataid))
+
+    if not results:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    sessions_df = pd.concat(results, ignore_index=True)[SESSION_COLUMNS]
+    return sessions_df
+
+
+def _detect_sessions(times: pd.DatetimeIndex,
+                     values: np.ndarray,
+                     state: Union[dict, None],
+                     threshold: float,
+                     freq: str,
+                     max_gap: Union[str, None]) -> Tuple[pd.DataFrame, Union[dict, None]]:
+    """
+    Find the runs of readings above `threshold` in a chunk. Returns the
+    completed sessions and the session still open at the end of the chunk
+    (as a dict), which is extended by the runs continuing it in the next chunk.
+
+    """
+    if len(values) == 0:
+        return _session_frame([], freq), state
+    interval = pd.Timedelta(to_offset(freq))
+    gap = pd.Timedelta(max_gap) if max_gap is not None else interval
+    charging = values > threshold
+
+    previous_charging = np.empty(len(values), dtype=bool)
+    previous_charging[:1] = state is not None
+    previous_charging[1:] = charging[:-1]
+    time_ns = times.asi8
+    gaps = np.empty(len(values), dtype=bool)
+    gaps[:1] = state is not None and time_ns[0] - state["last"].value > gap.value
+    gaps[1:] = np.diff(time_ns) > gap.value
+    starts = charging & (~previous_charging | gaps)
+
+    # run 0 continues the session left open by the previous chunk
+    runs = pd.DataFrame({"run": np.cumsum(starts)[charging],
+                         "time": times[charging],
+                         "kwh": values[charging] * (interval / pd.Timedelta(hours=1)),
+                         "peak_kw": values[charging]})
+    sessions = (runs.groupby("run")
+                    .agg(start=("time", "first"), last=("time", "last"),
+                         kwh=("kwh", "sum"), peak_kw=("peak_kw", "max"))
+                    .to_dict("records"))
+    if state is not None:
+        if sessions and runs["run"].iat[0] == 0:
+            continued = sessions[0]
+            sessions[0] = {"start": state["start"], "last": continued["last"],
+                           "kwh": state["kwh"] + continued["kwh"],
+                           "peak_kw": max(state["peak_kw"], continued["peak_kw"])}
+        else:
+            sessions.insert(0, state)
+    state = sessions.pop() if charging[-1] else None
+    return _session_frame(sessions, freq), state
+
+
+def _session_frame(sessions: List[dict], freq: str) -> pd.DataFrame:
+    df = pd.DataFrame(sessions, columns=["start", "last", "kwh", "peak_kw"])
+    df.insert(1, "end", df.pop("last") + pd.Timedelta(to_offset(freq)))
+    return df
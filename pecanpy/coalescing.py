@@ -0,0 +1,210 @@
+"""
+In-process coalescing of concurrent reader calls. Identical requests that are
+in flight at the same time share a single database query, and overlapping
+requests for the same household are merged into one wider query whose result
+is sliced for each caller.
+
+@author : davidrpugh
+
+"""
+from concurrent import futures
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+import pandas as pd
+import sqlalchemy
+
+from . electricity_egauge_api import read_electricity_egauge_query
+from . gas_water_api import (read_gas_ert_query, read_water_ert_query,
+                             read_water_capstone_query)
+from . utils import _to_timestamp
+
+
+class RequestCoalescer:
+    """
+    Coalesce concurrent reader calls made from multiple threads.
+
+    The first call for a particular household (and table, columns, etc.) waits
+    `linger` seconds for other calls to arrive. All calls received in the
+    meantime are grouped, overlapping or adjacent time ranges are merged and
+    each merged range is fetched with a single query, the queries for
+    disjoint ranges running concurrently. Calls whose time range
+    is covered by a query that is already in flight simply wait for that
+    query. Every caller receives its own copy of the rows in its time range.
+
+    Naive `start_time` and `end_time` values are interpreted in `tz`.
+
+    Parameters
+    ----------
+    linger : `float`, default: 0.005
+        Number of seconds to wait for other calls before querying the database.
+
+    Examples
+    --------
+    >>> coalescer = RequestCoalescer()
+    >>> df = coalescer.read_electricity_egauge_query(engine, schema, dataid,
+    ...                                              start_time, end_time)
+
+    """
+
+    def __init__(self, linger: float = 0.005):
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._pending = {}  # type: Dict[tuple, List[Tuple[pd.Timestamp, pd.Timestamp, futures.Future]]]
+        self._in_flight = {}  # type: Dict[tuple, List[Tuple[pd.Timestamp, pd.Timestamp, futures.Future]]]
+
+    def read_electricity_egauge_query(self,
+                                      con: sqlalchemy.engine.Connectable,
+                                      schema: str,
+                                      dataid: int,
+                                      start_time: Union[pd.Timestamp, str],
+                                      end_time: Union[pd.Timestamp, str],
+                                      columns: Union[List[str], str] = "all",
+                                      freq: str = 'T',
+                                      tz: str = "US/Central") -> pd.DataFrame:
+        """Coalescing version of `pecanpy.read_electricity_egauge_query`."""
+        def fetch(start, end):
+            return read_electricity_egauge_query(con, schema, dataid, start, end,
+                                                 columns, freq, tz)
+        columns_key = columns if isinstance(columns, str) else tuple(columns)
+        key = ("electricity_egauge", id(con), schema, dataid, columns_key, freq, tz)
+        return self._read(key, fetch, _to_timestamp(start_time, tz),
+                          _to_timestamp(end_time, tz))
+
+    def read_gas_ert_query(self,
+                           con: sqlalchemy.engine.Connectable,
+                           schema: str,
+                           dataid: int,
+                           start_time: Union[pd.Timestamp, str],
+                           end_time: Union[pd.Timestamp, str],
+                           tz: str = "US/Central") -> pd.DataFrame:
+        """Coalescing version of `pecanpy.read_gas_ert_query`."""
+        def fetch(start, end):
+            return read_gas_ert_query(con, schema, dataid, start, end, tz)
+        key = ("gas_ert", id(con), schema, dataid, tz)
+        return self._read(key, fetch, _to_timestamp(start_time, tz),
+                          _to_timestamp(end_time, tz))
+
+    def read_water_ert_query(self,
+                             con: sqlalchemy.engine.Connectable,
+                             schema: str,
+                             dataid: int,
+                             start_time: Union[pd.Timestamp, str],
+                             end_time: Union[pd.Timestamp, str],
+                             tz: str = "US/Central") -> pd.DataFrame:
+        """Coalescing version of `pecanpy.read_water_ert_query`."""
+        def fetch(start, end):
+            return read_water_ert_query(con, schema, dataid, start, end, tz)
+        key = ("water_ert", id(con), schema, dataid, tz)
+        return self._read(key, fetch, _to_timestamp(start_time, tz),
+                          _to_timestamp(end_time, tz))
+
+    def read_water_capstone_query(self,
+                                  con: sqlalchemy.engine.Connectable,
+                                  schema: str,
+                                  dataid: int,
+                                  start_time: Union[pd.Timestamp, str],
+                                  end_time: Union[pd.Timestamp, str],
+                                  tz: str = "US/Central") -> pd.DataFrame:
+        """Coalescing version of `pecanpy.read_water_capstone_query`."""
+        def fetch(start, end):
+            return read_water_capstone_query(con, schema, dataid, start, end, tz)
+        key = ("water_capstone", id(con), schema, dataid, tz)
+        return self._read(key, fetch, _to_timestamp(start_time, tz),
+                          _to_timestamp(end_time, tz))
+
+    def _read(self,
+              key: tuple,
+              fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame],
+              start: pd.Timestamp,
+              end: pd.Timestamp) -> pd.DataFrame:
+        with self._lock:
+            future = self._find_in_flight(key, start, end)
+            if future is None:
+                future = futures.Future()
+                group = self._pending.setdefault(key, [])
+                group.append((start, end, future))
+                is_leader = len(group) == 1
+            else:
+                is_leader = False
+
+        if is_leader:
+            time.sleep(self.linger)
+            self._execute(key, fetch, future)
+        return _slice(future.result(), start, end)
+
+    def _find_in_flight(self,
+                        key: tuple,
+                        start: pd.Timestamp,
+                        end: pd.Timestamp) -> Union[futures.Future, None]:
+        for fetch_start, fetch_end, future in self._in_flight.get(key, []):
+            if fetch_start <= start and end <= fetch_end:
+                return future
+        return None
+
+    def _execute(self,
+                 key: tuple,
+                 fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame],
+                 leader: futures.Future) -> None:
+        """
+        Fetch each merged range of the pending group concurrently. The leader
+        fetches the range containing its own request, while the other ranges
+        are fetched in separate threads, so that no caller waits for a
+        disjoint range.
+
+        """
+        with self._lock:
+            group = self._pending.pop(key)
+            merged = _merge_requests(group)
+            fetches = [(start, end, futures.Future()) for start, end, _ in merged]
+            self._in_flight.setdefault(key, []).extend(fetches)
+
+        own = None
+        for request, in_flight in zip(merged, fetches):
+            if leader in request[2]:
+                own = (request, in_flight)
+            else:
+                thread = threading.Thread(target=self._fetch,
+                                          args=(key, fetch, request, in_flight))
+                thread.start()
+        self._fetch(key, fetch, *own)
+
+    def _fetch(self,
+               key: tuple,
+               fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame],
+               request: Tuple[pd.Timestamp, pd.Timestamp, List[futures.Future]],
+               in_flight: Tuple[pd.Timestamp, pd.Timestamp, futures.Future]) -> None:
+        start, end, waiters = request
+        try:
+            try:
+                df = fetch(start, end)
+            except Exception as e:
+                for waiter in waiters + [in_flight[2]]:
+                    waiter.set_exception(e)
+            else:
+                for waiter in waiters + [in_flight[2]]:
+                    waiter.set_result(df)
+        finally:
+            with self._lock:
+                remaining = [f for f in self._in_flight[key] if f is not in_flight]
+                if remaining:
+                    self._in_flight[key] = remaining
+                else:
+                    del self._in_flight[key]
+
+
+def _merge_requests(requests: List[Tuple[pd.Timestamp, pd.Timestamp, futures.Future]]) -> list:
+    """Merge overlapping or adjacent time ranges, keeping track of their futures."""
+    merged = []
+    for start, end, future in sorted(requests, key=lambda request: request[0]):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2].append(future)
+        else:
+            merged.append([start, end, [future]])
+    return [tuple(request) for request in merged]
+
+
+def _slice(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    return df[(df.index >= start) & (df.index < end)].copy()
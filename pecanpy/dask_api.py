@@ -0,0 +1,292 @@
+"""
+Functions for reading electricity egauge and ERT tables from the Pecan Street
+Dataport into lazy, partitioned Dask DataFrame instances. Each partition covers
+a time window (and optionally a batch of households) and is fetched by its own
+query, so a cluster of workers reads the partitions in parallel. Only the
+columns and rows a computation needs are requested from the database: column
+projections made by Dask and any `filters` are pushed into each partition's
+SQL. Requires `dask`.
+
+@author : davidrpugh
+
+"""
+from typing import List, Tuple, Union
+
+import dask.dataframe as dd
+from dask.dataframe.io.utils import DataFrameIOFunction
+import pandas as pd
+import sqlalchemy
+
+from . backends import read_query
+from . electricity_egauge_api import _egauge_table_kwargs
+from . utils import _set_time_index, _time_windows, _to_timestamp
+
+
+_engines = {}  # each worker process creates its own engine per database
+
+_FILTER_OPERATORS = {"==": "=", "=": "=", "!=": "<>", "<": "<", "<=": "<=",
+                     ">": ">", ">=": ">=", "in": "IN", "not in": "NOT IN"}
+
+
+def read_electricity_egauge_dask(con: Union[sqlalchemy.engine.Engine, str],
+                                 schema: str,
+                                 dataids: List[int],
+                                 start_time: Union[pd.Timestamp, str],
+                                 end_time: Union[pd.Timestamp, str],
+                                 columns: Union[List[str], str] = "all",
+                                 freq: str = 'T',
+                                 tz: str = "US/Central",
+                                 partition_freq: str = "7D",
+                                 dataids_per_partition: Union[int, None] = None,
+                                 filters: Union[List[Tuple[str, str, object]], None] = None):
+    """
+    Read electricity egauge data for several households from a database into
+    a lazy `dask.dataframe.DataFrame`.
+
+    Parameters
+    ----------
+    con : `Union[sqlalchemy.engine.Engine, str]`
+        Engine connected to the database, or its URL. Only the URL is sent to
+        the workers, each of which creates its own engine.
+    schema : `str`
+        Name of a schema containing the "electricity_egauge_minutes",
+        "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
+    dataids : `List[int]`
+        The unique identifiers for the households.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+        Naive values are interpreted in `tz`.
+    columns : `Union[List[str], str]`, default: "all"
+    freq : `str`, default: 'T'
+        The desired sampling frequency for the returned electricity egauge data.
+        Must be one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+    partition_freq : `str`, default: "7D"
+        Length of the time window covered by each partition.
+    dataids_per_partition : `Union[int, None]`, default: `None`
+        If specified, each time window is further split into partitions of
+        this many households.
+    filters : `Union[List[Tuple[str, str, object]], None]`, default: `None`
+        Row filters, such as `[("use", ">", 0)]`, added to each partition's
+        query. Supported operators are "==", "!=", "<", "<=", ">", ">=", "in"
+        and "not in".
+
+    Returns
+    -------
+    ddf: `dask.dataframe.DataFrame`
+
+        Electricity egauge data for all households, indexed by timestamp and
+        ordered by timestamp and dataid within each partition.
+
+    Raises
+    ------
+    ValueError
+        If `freq` is not one of 'T', "15T", or 'H'.
+
+    Notes
+    -----
+    Partitions are computed wherever the active Dask
+    scheduler runs them; for testing, create a
+    `dask.distributed.Client(dask.distributed.LocalCluster())` before calling
+    `compute`. The divisions of the result are known (the time window
+    boundaries) unless `dataids_per_partition` is specified, in which case
+    partitions of the same window overlap.
+
+    """
+    kwargs = _egauge_table_kwargs(freq)
+    if columns != "all":
+        columns = ["dataid"] + [column for column in columns if column != "dataid"]
+    return _read_dask(con, schema, kwargs["table"], kwargs["local_minute"], columns,
+                      dataids, start_time, end_time, tz, partition_freq,
+                      dataids_per_partition, filters)
+
+
+def read_gas_ert_dask(con: Union[sqlalchemy.engine.Engine, str],
+                      schema: str,
+                      dataids: List[int],
+                      start_time: Union[pd.Timestamp, str],
+                      end_time: Union[pd.Timestamp, str],
+                      tz: str = "US/Central",
+                      partition_freq: str = "30D",
+                      dataids_per_partition: Union[int, None] = None,
+                      filters: Union[List[Tuple[str, str, object]], None] = None):
+    """
+    Read gas ERT data for several households from a database into a lazy
+    `dask.dataframe.DataFrame`.
+
+    See `read_electricity_egauge_dask` for a description of the parameters.
+
+    """
+    return _read_dask(con, schema, "gas_ert", "readtime", ["dataid", "meter_value"],
+                      dataids, start_time, end_time, tz, partition_freq,
+                      dataids_per_partition, filters)
+
+
+def read_water_ert_dask(con: Union[sqlalchemy.engine.Engine, str],
+                        schema: str,
+                        dataids: List[int],
+                        start_time: Union[pd.Timestamp, str],
+                        end_time: Union[pd.Timestamp, str],
+                        tz: str = "US/Central",
+                        partition_freq: str = "30D",
+                        dataids_per_partition: Union[int, None] = None,
+                        filters: Union[List[Tuple[str, str, object]], None] = None):
+    """
+    Read water ERT data for several households from a database into a lazy
+    `dask.dataframe.DataFrame`.
+
+    See `read_electricity_egauge_dask` for a description of the parameters.
+
+    """
+    return _read_dask(con, schema, "water_ert", "readtime", ["dataid", "meter_value"],
+                      dataids, start_time, end_time, tz, partition_freq,
+                      dataids_per_partition, filters)
+
+
+def _read_dask(con: Union[sqlalchemy.engine.Engine, str],
+               schema: str,
+               table: str,
+               time_column: str,
+               columns: Union[List[str], str],
+               dataids: List[int],
+               start_time: Union[pd.Timestamp, str],
+               end_time: Union[pd.Timestamp, str],
+               tz: str,
+               partition_freq: str,
+               dataids_per_partition: Union[int, None],
+               filters: Union[List[Tuple[str, str, object]], None]):
+    url = sqlalchemy.engine.make_url(con) if isinstance(con, str) else con.url
+    start, end = _to_timestamp(start_time, tz), _to_timestamp(end_time, tz)
+    windows = _time_windows(start, end, partition_freq)
+    batch = len(dataids) if dataids_per_partition is None else dataids_per_partition
+    batches = [tuple(dataids[i:i + batch]) for i in range(0, len(dataids), batch)]
+    parts = [(dataid_batch, window_start, window_end)
+             for window_start, window_end in windows
+             for dataid_batch in batches]
+
+    reader = _PartitionReader(url, schema, table, time_column, columns, tz,
+                              _filters_sql(filters))
+    meta = reader.read_meta(parts[0])
+    reader = reader.with_meta(meta)
+    divisions = None
+    if len(batches) == 1:
+        divisions = tuple(window_start for window_start, _ in windows) + (end,)
+    return dd.from_map(reader, parts, meta=meta, divisions=divisions,
+                       label="read-{}".format(table))
+
+
+class _PartitionReader(DataFrameIOFunction):
+    """
+    Callable reading one (dataid batch, start, end) partition. Dask pushes
+    column projections into it, either through its `columns` keyword argument
+    or through the `DataFrameIOFunction` protocol.
+
+    """
+
+    def __init__(self,
+                 url: sqlalchemy.engine.url.URL,
+                 schema: str,
+                 table: str,
+                 time_column: str,
+                 columns: Union[List[str], str],
+                 tz: str,
+                 predicates: List[str],
+                 meta: Union[pd.DataFrame, None] = None):
+        self.url = url
+        self.schema = schema
+        self.table = table
+        self.time_column = time_column
+        self._columns = columns
+        self.tz = tz
+        self.predicates = predicates
+        self.meta = meta
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def project_columns(self, columns):
+        """Return a reader selecting only `columns`."""
+        if list(columns) == list(self._columns):
+            return self
+        return _PartitionReader(self.url, self.schema, self.table, self.time_column,
+                                list(columns), self.tz, self.predicates,
+                                self.meta[list(columns)])
+
+    def with_meta(self, meta: pd.DataFrame):
+        return _PartitionReader(self.url, self.schema, self.table, self.time_column,
+                                list(meta.columns), self.tz, self.predicates, meta)
+
+    def read_meta(self, part: Tuple[Tuple[int, ...], pd.Timestamp, pd.Timestamp]) -> pd.DataFrame:
+        """
+        Read a few rows of a partition to find the names and dtypes of the
+        columns. If the partition is empty, rows of its first household from
+        the start of its window are read instead, which a `(dataid, time)`
+        index returns without sorting the household's history.
+
+        """
+        dataids, start, end = part
+        df = self._read(dataids, start, end, limit=100)
+        if len(df) == 0:
+            df = self._read(dataids[:1], start, None, limit=100)
+        return df.iloc[:0]
+
+    def __call__(self,
+                 part: Tuple[Tuple[int, ...], pd.Timestamp, pd.Timestamp],
+                 columns: Union[List[str], None] = None) -> pd.DataFrame:
+        if columns is not None:
+            return self.project_columns(columns)(part)
+        dataids, start, end = part
+        df = self._read(dataids, start, end)
+        if len(df) == 0:
+            return self.meta
+        return df.astype(self.meta.dtypes.to_dict(), copy=False)
+
+    def _read(self,
+              dataids: Tuple[int, ...],
+              start: Union[pd.Timestamp, None],
+              end: Union[pd.Timestamp, None],
+              limit: Union[int, None] = None) -> pd.DataFrame:
+        predicates = ["dataid IN ({})".format(", ".join(str(dataid) for dataid in dataids))]
+        if start is not None:
+            predicates.append("{} >= '{}'".format(self.time_column, start))
+        if end is not None:
+            predicates.append("{} < '{}'".format(self.time_column, end))
+        template = """SELECT {columns} FROM {schema}.{table}
+                      WHERE {predicates}
+                      ORDER BY {time_column}, dataid{limit};"""
+        kwargs = {"columns": '*' if self._columns == "all" else ", ".join([self.time_column] + self._columns),
+                  "schema": self.schema,
+                  "table": self.table,
+                  "predicates": " AND\n".join(predicates + self.predicates),
+                  "time_column": self.time_column,
+                  "limit": '' if limit is None else " LIMIT {}".format(limit)}
+        df = read_query(_engine(self.url), template.format(**kwargs),
+                        parse_dates={self.time_column: {"utc": True}})
+        return _set_time_index(df, self.time_column, self.tz)
+
+
+def _engine(url: sqlalchemy.engine.url.URL) -> sqlalchemy.engine.Engine:
+    if url not in _engines:
+        _engines[url] = sqlalchemy.create_engine(url)
+    return _engines[url]
+
+
+def _filters_sql(filters: Union[List[Tuple[str, str, object]], None]) -> List[str]:
+    """Translate `(column, operator, value)` filters into SQL predicates."""
+    predicates = []
+    for column, operator, value in filters or []:
+        if operator not in _FILTER_OPERATORS:
+            raise ValueError("Unsupported filter operator '{}'.".format(operator))
+        if operator in ("in", "not in"):
+            literal = "({})".format(", ".join(_sql_literal(v) for v in value))
+        else:
+            literal = _sql_literal(value)
+        predicates.append("{} {} {}".format(column, _FILTER_OPERATORS[operator], literal))
+    return predicates
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, (bool, int, float)):
+        return str(value)
+    return "'{}'".format(str(value).replace("'", "''"))
@@ -0,0 +1,244 @@
+"""
+Functions for diagnosing slow reader queries on a PostgreSQL replica of the
+Pecan Street Dataport. The SQL generated by a reader is run through
+`EXPLAIN (ANALYZE, BUFFERS)` and the resulting plan is summarised, flagging
+sequential scans and sorts on the time series tables together with the
+composite indexes that would avoid them.
+
+@author : davidrpugh
+
+"""
+from typing import List, NamedTuple, Union
+
+import pandas as pd
+import sqlalchemy
+
+from . electricity_egauge_api import _egauge_table_kwargs, _electricity_egauge_sql
+from . gas_water_api import _time_series_sql
+from . planning import _explain, _is_postgresql
+
+
+# datetime column of each time series table/view
+_TIME_SERIES_TABLES = {"electricity_egauge_minutes": "localminute",
+                       "electricity_egauge_15min": "local_15min",
+                       "electricity_egauge_hours": "localhour",
+                       "gas_ert": "readtime",
+                       "water_ert": "readtime",
+                       "water_capstone": "localminute"}
+
+
+class QueryDiagnostics(NamedTuple):
+    """
+    Summary of the execution plan of a query.
+
+    Attributes
+    ----------
+    plan : `pandas.DataFrame`
+        One row per plan node (in depth-first order) with the node type,
+        relation, index, estimated and actual rows, shared buffers hit and
+        read, and actual time in milliseconds.
+    planning_time : `float`
+        Planning time in milliseconds.
+    execution_time : `float`
+        Execution time in milliseconds (missing unless `analyze` was used).
+    warnings : `List[str]`
+        Problems found in the plan.
+    suggested_indexes : `List[str]`
+        `CREATE INDEX` statements that would address the problems.
+
+    """
+    plan: pd.DataFrame
+    planning_time: float
+    execution_time: float
+    warnings: List[str]
+    suggested_indexes: List[str]
+
+
+def diagnose_query(con: sqlalchemy.engine.Connectable,
+                   query: str,
+                   schema: Union[str, None] = None,
+                   analyze: bool = True) -> QueryDiagnostics:
+    """
+    Explain a query and summarise its execution plan.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs connected to a
+        PostgreSQL database.
+    query : `str`
+        SQL select query.
+    schema : `Union[str, None]`, default: `None`
+        Schema used in suggested indexes when the plan does not report one.
+    analyze : `bool`, default: `True`
+        If `True`, use `EXPLAIN (ANALYZE, BUFFERS)`, which executes the query
+        and reports actual rows, buffers and timings. Otherwise only the
+        planner estimates are reported.
+
+    Returns
+    -------
+    diagnostics: `QueryDiagnostics`
+
+    Raises
+    ------
+    ValueError
+        If `con` is not connected to a PostgreSQL database.
+
+    """
+    if not _is_postgresql(con):
+        raise ValueError("Query diagnostics require a PostgreSQL database.")
+
+    options = "ANALYZE, BUFFERS, VERBOSE, FORMAT JSON" if analyze else "VERBOSE, FORMAT JSON"
+    explained = _explain(con, query, options)
+    nodes = list(_walk_plan(explained["Plan"]))
+    plan = pd.DataFrame([_summarise_node(node, depth) for node, depth in nodes])
+
+    warnings, suggested_indexes = [], []
+    for node, _ in nodes:
+        for warning, index in _advise(node, schema):
+            warnings.append(warning)
+            if index not in suggested_indexes:
+                suggested_indexes.append(index)
+
+    diagnostics = QueryDiagnostics(plan=plan,
+                                   planning_time=explained.get("Planning Time", float("nan")),
+                                   execution_time=explained.get("Execution Time", float("nan")),
+                                   warnings=warnings,
+                                   suggested_indexes=suggested_indexes)
+    return diagnostics
+
+
+def diagnose_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
+                                      schema: str,
+                                      dataid: int,
+                                      start_time: Union[pd.Timestamp, str],
+                                      end_time: Union[pd.Timestamp, str],
+                                      columns: Union[List[str], str] = "all",
+                                      freq: str = 'T',
+                                      analyze: bool = True) -> QueryDiagnostics:
+    """
+    Diagnose the query generated by `read_electricity_egauge_query`.
+
+    Parameters are the same as for `read_electricity_egauge_query`; see
+    `diagnose_query` for `analyze` and the returned value.
+
+    """
+    kwargs = _egauge_table_kwargs(freq)
+    query = _electricity_egauge_sql(schema, kwargs["table"], kwargs["local_minute"],
+                                    dataid, start_time, end_time, columns)
+    return diagnose_query(con, query, schema, analyze)
+
+
+def diagnose_gas_ert_query(con: sqlalchemy.engine.Connectable,
+                           schema: str,
+                           dataid: int,
+                           start_time: Union[pd.Timestamp, str],
+                           end_time: Union[pd.Timestamp, str],
+                           analyze: bool = True) -> QueryDiagnostics:
+    """
+    Diagnose the query generated by `read_gas_ert_query`.
+
+    Parameters are the same as for `read_gas_ert_query`; see `diagnose_query`
+    for `analyze` and the returned value.
+
+    """
+    query = _time_series_sql(schema, "gas_ert", "readtime", ["meter_value"],
+                             dataid, start_time, end_time)
+    return diagnose_query(con, query, schema, analyze)
+
+
+def diagnose_water_ert_query(con: sqlalchemy.engine.Connectable,
+                             schema: str,
+                             dataid: int,
+                             start_time: Union[pd.Timestamp, str],
+                             end_time: Union[pd.Timestamp, str],
+                             analyze: bool = True) -> QueryDiagnostics:
+    """
+    Diagnose the query generated by `read_water_ert_query`.
+
+    Parameters are the same as for `read_water_ert_query`; see `diagnose_query`
+    for `analyze` and the returned value.
+
+    """
+    query = _time_series_sql(schema, "water_ert", "readtime", ["meter_value"],
+                             dataid, start_time, end_time)
+    return diagnose_query(con, query, schema, analyze)
+
+
+def diagnose_water_capstone_query(con: sqlalchemy.engine.Connectable,
+                                  schema: str,
+                                  dataid: int,
+                                  start_time: Union[pd.Timestamp, str],
+                                  end_time: Union[pd.Timestamp, str],
+                                  analyze: bool = True) -> QueryDiagnostics:
+    """
+    Diagnose the query generated by `read_water_capstone_query`.
+
+    Parameters are the same as for `read_water_capstone_query`; see
+    `diagnose_query` for `analyze` and the returned value.
+
+    """
+    query = _time_series_sql(schema, "water_capstone", "localminute", ["consumption"],
+                             dataid, start_time, end_time)
+    return diagnose_query(con, query, schema, analyze)
+
+
+def _walk_plan(node: dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from _walk_plan(child, depth + 1)
+
+
+def _summarise_node(node: dict, depth: int) -> dict:
+    summary = {"depth": depth,
+               "node_type": node["Node Type"],
+               "relation": node.get("Relation Name"),
+               "index": node.get("Index Name"),
+               "condition": node.get("Index Cond", node.get("Filter")),
+               "sort_key": ", ".join(node.get("Sort Key", [])) or None,
+               "plan_rows": node.get("Plan Rows"),
+               "actual_rows": node.get("Actual Rows"),
+               "actual_loops": node.get("Actual Loops"),
+               "actual_time": node.get("Actual Total Time"),
+               "shared_hit_blocks": node.get("Shared Hit Blocks"),
+               "shared_read_blocks": node.get("Shared Read Blocks")}
+    return summary
+
+
+def _advise(node: dict, schema: Union[str, None]):
+    """Yield (warning, suggested index) pairs for a single plan node."""
+    if node["Node Type"] == "Seq Scan":
+        scans = [node]
+    elif node["Node Type"] in ("Sort", "Incremental Sort"):
+        scans = [child for child, _ in _walk_plan(node) if "Relation Name" in child]
+    else:
+        return
+
+    for scan in scans:
+        time_column = _time_column(scan)
+        if time_column is None:
+            continue
+        relation = scan["Relation Name"]
+        relation_schema = scan.get("Schema", schema)
+        qualified = relation if relation_schema is None else "{}.{}".format(relation_schema, relation)
+        index = "CREATE INDEX ON {} (dataid, {});".format(qualified, time_column)
+        if node["Node Type"] == "Seq Scan":
+            warning = "Sequential scan on time series table {}.".format(qualified)
+        else:
+            warning = "Sort of rows read from time series table {} on {}.".format(
+                qualified, ", ".join(node.get("Sort Key", [])))
+        yield warning, index
+
+
+def _time_column(scan: dict) -> Union[str, None]:
+    """Return the datetime column of a scanned time series table, if any."""
+    relation = scan.get("Relation Name")
+    if relation in _TIME_SERIES_TABLES:
+        return _TIME_SERIES_TABLES[relation]
+    # the Dataport views may be backed by tables with other names
+    condition = scan.get("Filter", "") + scan.get("Index Cond", "")
+    if "dataid" in condition:
+        for time_column in set(_TIME_SERIES_TABLES.values()):
+            if time_column in condition:
+                return time_column
+    return None
@@ -6,13 +6,17 @@ DataFrame instances.
 @author : davidrpugh
 
 """
-from typing import Generator, List, Union
+import time
+from typing import Callable, Generator, List, Union
 
 import numpy as np
 import pandas as pd
 from pandas.api import types
 import sqlalchemy
 
+from . backends import read_query
+from . utils import _set_time_index
+
 
 def read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
                                   schema: str,
@@ -22,7 +26,11 @@ def read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
                                   columns: Union[List[str], str] = "all",
                                   freq: str = 'T',
                                   tz: str = "US/Central",
-                                  chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
+                                  chunksize: Union[int, None] = None,
+                                  retries: int = 0,
+                                  backoff: float = 1.0,
+                                  memory_budget: Union[int, None] = None,
+                                  spill_directory: Union[str, None] = None):
     """
     Read electricity egauge data from a database into a `pandas.DataFrame`.
 
@@ -31,7 +39,8 @@ def read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the "electricity_egauge_minutes",
         "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
@@ -47,10 +56,29 @@ def read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
     chunksize : `Union[int, None]`, default: `None`.
         If specified, return an iterator where chunksize is the number of rows
         to include in each chunk.
+    retries : `int`, default: 0
+        If positive, the rows received before a connection failure or
+        statement timeout (`sqlalchemy.exc.OperationalError`, or any
+        `sqlalchemy.exc.DBAPIError` that invalidated the connection) are kept
+        and the query is re-issued from the last timestamp received, up to
+        `retries` times.
+    backoff : `float`, default: 1.0
+        Seconds to wait before the first retry, doubling for each subsequent
+        retry.
+    memory_budget : `Union[int, None]`, default: `None`
+        If specified, the size of the result is estimated before it is fetched
+        and a `QueryResult` is returned: the result is held in memory if it
+        fits within `memory_budget` bytes and is otherwise streamed in chunks
+        that do (or spilled to disk, see `spill_directory`). Overrides
+        `chunksize`. The size is estimated with `estimate_query_rows`, which
+        executes the query an extra time on backends other than PostgreSQL.
+    spill_directory : `Union[str, None]`, default: `None`
+        If specified, results exceeding `memory_budget` are spilled to a
+        Parquet file in this directory rather than streamed.
 
     Returns
     -------
-    results_df: `pandas.DataFrame`
+    results_df: `Union[pandas.DataFrame, Generator, QueryResult]`
 
         Electricity egauge data for a particular household.
 
@@ -62,23 +90,18 @@ def read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
     """
     kwargs = {"con": con, "schema": schema, "dataid": dataid,
               "start_time": start_time, "end_time": end_time,
-              "columns": columns, "tz": tz, "chunksize": chunksize}
-    if freq == 'T':
-        minutes_kwargs = {"table": "electricity_egauge_minutes",
-                          "local_minute": "localminute"}
-        kwargs.update(minutes_kwargs)
-    elif freq == "15T":
-        qtr_hour_kwargs = {"table": "electricity_egauge_15min",
-                           "local_minute": "local_15min"}
-        kwargs.update(qtr_hour_kwargs)
-    elif freq == 'H':
-        hour_kwargs = {"table": "electricity_egauge_hours",
-                       "local_minute": "localhour"}
-        kwargs.update(hour_kwargs)
-    else:
-        msg = """The 'freq' keyword argument must be one of 'T' (minutes),
-                 '15T' (15 minutes), or 'H' (hourly)."""
-        raise ValueError(msg)
+              "columns": columns, "tz": tz, "chunksize": chunksize,
+              "retries": retries, "backoff": backoff}
+    kwargs.update(_egauge_table_kwargs(freq))
+    if memory_budget is not None:
+        from . results import _read_with_budget
+
+        query = _electricity_egauge_sql(schema, kwargs["table"], kwargs["local_minute"],
+                                        dataid, start_time, end_time, columns)
+        def read(chunksize):
+            return _read_electricity_egauge_query(**dict(kwargs, chunksize=chunksize))
+
+        return _read_with_budget(con, query, read, memory_budget, spill_directory)
     results_df = _read_electricity_egauge_query(**kwargs)
     return results_df
 
@@ -92,7 +115,9 @@ def _read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
                                    end_time: Union[pd.Timestamp, str],
                                    columns: Union[List[str], str],
                                    tz: str,
-                                   chunksize: Union[int, None]) -> Union[pd.DataFrame, Generator]:
+                                   chunksize: Union[int, None],
+                                   retries: int = 0,
+                                   backoff: float = 1.0) -> Union[pd.DataFrame, Generator]:
     """
     Read electricity egauge data from a database into a `pandas.DataFrame`.
 
@@ -101,7 +126,8 @@ def _read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the "electricity_egauge_minutes",
         "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
@@ -120,6 +146,10 @@ def _read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
     chunksize : `Union[int, None]`, default: `None`.
         If specified, return an iterator where chunksize is the number of rows
         to include in each chunk.
+    retries : `int`, default: 0
+        Number of times to resume the query after a connection failure.
+    backoff : `float`, default: 1.0
+        Seconds to wait before the first retry, doubling for each retry.
 
     Returns
     -------
@@ -128,6 +158,74 @@ def _read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
         Electricity egauge data for a particular household.
 
     """
+    def build_query(resume_time):
+        start = start_time if resume_time is None else resume_time
+        return _electricity_egauge_sql(schema, table, local_minute, dataid,
+                                       start, end_time, columns)
+
+    parse_dates= {local_minute: {"utc": True}}
+    if retries > 0:
+        chunks = _read_resumable(con, build_query, local_minute,
+                                 chunksize or _RESUMABLE_CHUNKSIZE, retries, backoff)
+        if chunksize is not None:
+            return (_set_time_index(chunk, local_minute, tz) for chunk in chunks)
+        chunks = list(chunks)
+        if not chunks:
+            chunks = [read_query(con, build_query(None), parse_dates=parse_dates)]
+        return _set_time_index(pd.concat(chunks, ignore_index=True), local_minute, tz)
+
+    df = read_query(con, build_query(None), parse_dates=parse_dates,
+                    chunksize=chunksize)
+    if chunksize is not None:
+        return (_set_time_index(chunk, local_minute, tz) for chunk in df)
+    return _set_time_index(df, local_minute, tz)
+
+
+def _read_resumable(con: sqlalchemy.engine.Connectable,
+                    build_query: Callable[[Union[pd.Timestamp, None]], str],
+                    time_column: str,
+                    chunksize: int,
+                    retries: int,
+                    backoff: float) -> Generator:
+    """
+    Yield the chunks of a query ordered by `time_column`. After a connection
+    failure the query returned by `build_query(last_time)` is issued, and rows
+    up to the last timestamp already received are skipped. Chunks are streamed
+    from a server-side cursor (see `read_query`), so those received before a
+    failure are not fetched again. A `sqlalchemy.engine.Connection` is rolled
+    back before retrying so that it can reconnect.
+
+    """
+    parse_dates = {time_column: {"utc": True}}
+    last_time = None
+    for attempt in range(retries + 1):
+        try:
+            chunks = read_query(con, build_query(last_time), parse_dates=parse_dates,
+                                chunksize=chunksize)
+            for chunk in chunks:
+                if last_time is not None:
+                    chunk = chunk[chunk[time_column] > last_time].copy()
+                if len(chunk) > 0:
+                    last_time = chunk[time_column].iloc[-1]
+                    yield chunk
+            return
+        except sqlalchemy.exc.DBAPIError as error:
+            dropped = isinstance(error, sqlalchemy.exc.OperationalError) or error.connection_invalidated
+            if not dropped or attempt == retries:
+                raise
+            if isinstance(con, sqlalchemy.engine.Connection):
+                con.rollback()  # an invalidated connection only reconnects once rolled back
+            time.sleep(backoff * 2**attempt)
+
+
+def _electricity_egauge_sql(schema: str,
+                            table: str,
+                            local_minute: str,
+                            dataid: int,
+                            start_time: Union[pd.Timestamp, str],
+                            end_time: Union[pd.Timestamp, str],
+                            columns: Union[List[str], str]) -> str:
+    """Generate the SQL used to read electricity egauge data for a household."""
     template = """SELECT {columns} FROM {schema}.{table}
                   WHERE dataid={dataid} AND
                     {local_minute} >= '{start_time}' AND
@@ -140,10 +238,149 @@ def _read_electricity_egauge_query(con: sqlalchemy.engine.Connectable,
               "dataid": dataid,
               "start_time": start_time,
               "end_time": end_time}
+    return template.format(**kwargs)
+
+
+def read_electricity_egauge_daily_summary(con: sqlalchemy.engine.Connectable,
+                                          schema: str,
+                                          dataids: List[int],
+                                          start_time: Union[pd.Timestamp, str],
+                                          end_time: Union[pd.Timestamp, str],
+                                          columns: Union[List[str], None] = None,
+                                          freq: str = 'T',
+                                          tz: str = "US/Central",
+                                          baseload_window: int = 60) -> pd.DataFrame:
+    """
+    Compute daily load-profile summary statistics for electricity egauge data
+    in the database and read the results into a `pandas.DataFrame`.
+
+    The statistics are computed by a single SQL query grouped by dataid and
+    local day, so only one row per household per day is transferred. For each
+    circuit in `columns` the following statistics are returned.
+
+    - "<column>_kwh": total energy consumed during the day.
+    - "<column>_peak_kw": peak demand during the day.
+    - "<column>_peak_time": timestamp at which peak demand first occurred.
+    - "<column>_load_factor": ratio of average to peak demand.
+    - "<column>_baseload_kw": minimum of the rolling mean demand.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the "electricity_egauge_minutes",
+        "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
+    dataids : `List[int]`
+        The unique identifiers for the households.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+    columns : `Union[List[str], None]`, default: `None`
+        Circuits to summarise. Defaults to ["use"].
+    freq : `str`, default: 'T'
+        Sampling frequency of the electricity egauge data to summarise. Must
+        be one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+        Time zone used to define local days.
+    baseload_window : `int`, default: 60
+        Length, in minutes, of the rolling mean used to compute baseload.
+        Readings are assumed to be regularly spaced. Only windows with a
+        reading in every position count, so days without a full window (e.g.,
+        a first day shorter than the window) have no baseload.
+
+    Returns
+    -------
+    results_df: `pandas.DataFrame`
+
+        Daily summary statistics indexed by dataid and local day.
+
+    Raises
+    ------
+    ValueError
+        If `freq` is not one of 'T', "15T", or 'H'.
+
+    """
+    table_kwargs = _egauge_table_kwargs(freq)
+    local_minute = table_kwargs["local_minute"]
+    columns = ["use"] if columns is None else columns
+    hours_per_reading = _HOURS_PER_READING[freq]
+    window_size = max(1, int(round(baseload_window / (60 * hours_per_reading))))
+
+    local_day = "CAST({} AT TIME ZONE '{}' AS DATE)".format(local_minute, tz)
+    window_columns, summary_columns = [], []
+    for column in columns:
+        window_columns.append(
+            """CASE WHEN COUNT({column}) OVER (PARTITION BY dataid ORDER BY {local_minute}
+                   ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW) = {window_size}
+                 THEN AVG({column}) OVER (PARTITION BY dataid ORDER BY {local_minute}
+                   ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+               END AS {column}_rolling,
+               FIRST_VALUE({local_minute}) OVER (PARTITION BY dataid, {local_day}
+                 ORDER BY {column} DESC NULLS LAST, {local_minute}) AS {column}_peak_time"""
+            .format(column=column, local_minute=local_minute, local_day=local_day,
+                    preceding=window_size - 1, window_size=window_size))
+        summary_columns.append(
+            """SUM({column}) * {hours} AS {column}_kwh,
+               MAX({column}) AS {column}_peak_kw,
+               MIN({column}_peak_time) AS {column}_peak_time,
+               AVG({column}) / NULLIF(MAX({column}), 0) AS {column}_load_factor,
+               MIN({column}_rolling) AS {column}_baseload_kw"""
+            .format(column=column, hours=hours_per_reading))
+
+    template = """WITH readings AS (
+                    SELECT dataid, {local_day} AS local_day, {columns},
+                      {window_columns}
+                    FROM {schema}.{table}
+                    WHERE dataid IN ({dataids}) AND
+                      {local_minute} >= '{start_time}' AND
+                      {local_minute} < '{end_time}'
+                  )
+                  SELECT dataid, local_day, {summary_columns}
+                  FROM readings
+                  GROUP BY dataid, local_day
+                  ORDER BY dataid, local_day;"""
+    kwargs = {"local_day": local_day,
+              "columns": ", ".join([local_minute] + columns),
+              "window_columns": ",\n".join(window_columns),
+              "schema": schema,
+              "table": table_kwargs["table"],
+              "dataids": ", ".join(str(dataid) for dataid in dataids),
+              "local_minute": local_minute,
+              "start_time": start_time,
+              "end_time": end_time,
+              "summary_columns": ",\n".join(summary_columns)}
     query = template.format(**kwargs)
-    parse_dates= {local_minute: {"utc": True}}
-    df = pd.read_sql_query(query, con=con, parse_dates=parse_dates,
-                           chunksize=chunksize)
-    df[local_minute] = df[local_minute].dt.tz_convert(tz)
-    df.set_index(local_minute, inplace=True)
-    return df
+    peak_time_columns = ["{}_peak_time".format(column) for column in columns]
+    parse_dates = {column: {"utc": True} for column in peak_time_columns}
+    parse_dates["local_day"] = {}
+    results_df = read_query(con, query, parse_dates=parse_dates)
+    for column in peak_time_columns:
+        results_df[column] = results_df[column].dt.tz_convert(tz)
+    results_df.set_index(["dataid", "local_day"], inplace=True)
+    return results_df
+
+
+_RESUMABLE_CHUNKSIZE = 100000
+
+_HOURS_PER_READING = {'T': 1 / 60, "15T": 0.25, 'H': 1.0}
+
+
+def _egauge_table_kwargs(freq: str) -> dict:
+    """Return the table and datetime column holding egauge data at `freq`."""
+    if freq == 'T':
+        kwargs = {"table": "electricity_egauge_minutes",
+                  "local_minute": "localminute"}
+    elif freq == "15T":
+        kwargs = {"table": "electricity_egauge_15min",
+                  "local_minute": "local_15min"}
+    elif freq == 'H':
+        kwargs = {"table": "electricity_egauge_hours",
+                  "local_minute": "localhour"}
+    else:
+        msg = """The 'freq' keyword argument must be one of 'T' (minutes),
+                 '15T' (15 minutes), or 'H' (hourly)."""
+        raise ValueError(msg)
+    return kwargs
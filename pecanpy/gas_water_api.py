@@ -5,20 +5,24 @@ returning the results as properly formatted Pandas DataFrame instances.
 @author : davidrpugh
 
 """
-from typing import List, Union
+from typing import Generator, List, Union
 
 import numpy as np
 import pandas as pd
 from pandas.api import types
 import sqlalchemy
 
+from . backends import read_query, read_table
+from . utils import _set_time_index
+
 
 def read_gas_ert_query(con: sqlalchemy.engine.Connectable,
                        schema: str,
                        dataid: int,
                        start_time: Union[pd.Timestamp, str],
                        end_time: Union[pd.Timestamp, str],
-                       tz: str = "US/Central")-> pd.DataFrame:
+                       tz: str = "US/Central",
+                       chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
     """
     Read gas ERT data from a database into a `pandas.DataFrame`.
 
@@ -27,7 +31,8 @@ def read_gas_ert_query(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the `gas_ert` table/view.
     dataid : `int`
@@ -35,6 +40,9 @@ def read_gas_ert_query(con: sqlalchemy.engine.Connectable,
     start_time : `Union[pd.Timestamp, str]`
     end_time : `Union[pd.Timestamp, str]`
     tz : `str`, default: "US/Central"
+    chunksize : `Union[int, None]`, default: `None`.
+        If specified, return an iterator where chunksize is the number of rows
+        to include in each chunk.
 
     Returns
     -------
@@ -43,20 +51,8 @@ def read_gas_ert_query(con: sqlalchemy.engine.Connectable,
         Gas ERT data for a particular household.
 
     """
-    template = """SELECT readtime, meter_value FROM {schema}.gas_ert
-                  WHERE dataid={dataid} AND
-                    readtime >= '{start_time}' AND
-                    readtime < '{end_time}'
-                  ORDER BY readtime ASC;"""
-    kwargs = {"schema": schema,
-              "dataid": dataid,
-              "start_time": start_time,
-              "end_time": ert_end_time}
-    query = template.format(kwargs)
-    df = pd.read_sql_query(query, con=con, parse_dates=["readtime"])
-    df.readtime = df.readtime.dt.tz_convert(tz)
-    df.set_index("readtime", inplace=True)
-
+    df = _read_time_series_query(con, schema, "gas_ert", "readtime", ["meter_value"],
+                                 dataid, start_time, end_time, tz, chunksize)
     return df
 
 
@@ -70,7 +66,8 @@ def read_electric_vehicles_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the `electric_vechicles` table/view.
 
@@ -82,8 +79,8 @@ def read_electric_vehicles_table(con: sqlalchemy.engine.Connectable,
 
     """
     datetime_columns = ["delivery_date", "lease_end_date"]
-    df = pd.read_sql_table("electric_vehicles", con, schema, index_col="dataid",
-                           parse_dates=datetime_columns)
+    df = read_table(con, "electric_vehicles", schema, index_col="dataid",
+                    parse_dates=datetime_columns)
     return df
 
 
@@ -92,7 +89,8 @@ def read_water_ert_query(con: sqlalchemy.engine.Connectable,
                          dataid: int,
                          start_time: Union[pd.Timestamp, str],
                          end_time: Union[pd.Timestamp, str],
-                         tz: str = "US/Central")-> pd.DataFrame:
+                         tz: str = "US/Central",
+                         chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
     """
     Read water ERT data from a database into a `pandas.DataFrame`.
 
@@ -101,7 +99,8 @@ def read_water_ert_query(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the `water_ert` table/view.
     dataid : `int`
@@ -109,6 +108,9 @@ def read_water_ert_query(con: sqlalchemy.engine.Connectable,
     start_time : `Union[pd.Timestamp, str]`
     end_time : `Union[pd.Timestamp, str]`
     tz : `str`, default: "US/Central"
+    chunksize : `Union[int, None]`, default: `None`.
+        If specified, return an iterator where chunksize is the number of rows
+        to include in each chunk.
 
     Returns
     -------
@@ -117,20 +119,8 @@ def read_water_ert_query(con: sqlalchemy.engine.Connectable,
         Water ERT data for a particular household.
 
     """
-    template = """SELECT readtime, meter_value FROM {schema}.water_ert
-                  WHERE dataid={dataid} AND
-                    readtime >= '{start_time}' AND
-                    readtime < '{end_time}'
-                  ORDER BY readtime ASC;"""
-    kwargs = {"schema": schema,
-              "dataid": dataid,
-              "start_time": start_time,
-              "end_time": ert_end_time}
-    query = template.format(kwargs)
-    df = pd.read_sql_query(query, con=con, parse_dates=["readtime"])
-    df.readtime = df.readtime.dt.tz_convert(tz)
-    df.set_index("readtime", inplace=True)
-
+    df = _read_time_series_query(con, schema, "water_ert", "readtime", ["meter_value"],
+                                 dataid, start_time, end_time, tz, chunksize)
     return df
 
 
@@ -139,7 +129,8 @@ def read_water_capstone_query(con: sqlalchemy.engine.Connectable,
                               dataid: int,
                               start_time: Union[pd.Timestamp, str],
                               end_time: Union[pd.Timestamp, str],
-                              tz: str = "US/Central")-> pd.DataFrame:
+                              tz: str = "US/Central",
+                              chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
     """
     Read water capstone data from a database into a `pandas.DataFrame`.
 
@@ -148,7 +139,8 @@ def read_water_capstone_query(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the `water_capstone` table/view.
     dataid : `int`
@@ -156,6 +148,9 @@ def read_water_capstone_query(con: sqlalchemy.engine.Connectable,
     start_time : `Union[pd.Timestamp, str]`
     end_time : `Union[pd.Timestamp, str]`
     tz : `str`, default: "US/Central"
+    chunksize : `Union[int, None]`, default: `None`.
+        If specified, return an iterator where chunksize is the number of rows
+        to include in each chunk.
 
     Returns
     -------
@@ -164,18 +159,50 @@ def read_water_capstone_query(con: sqlalchemy.engine.Connectable,
         Water capstone data for a particular household.
 
     """
-    template = """SELECT localminute, consumption FROM {schema}.water_capstone
+    df = _read_time_series_query(con, schema, "water_capstone", "localminute", ["consumption"],
+                                 dataid, start_time, end_time, tz, chunksize)
+    return df
+
+
+def _read_time_series_query(con: sqlalchemy.engine.Connectable,
+                            schema: str,
+                            table: str,
+                            time_column: str,
+                            columns: List[str],
+                            dataid: int,
+                            start_time: Union[pd.Timestamp, str],
+                            end_time: Union[pd.Timestamp, str],
+                            tz: str,
+                            chunksize: Union[int, None]) -> Union[pd.DataFrame, Generator]:
+    """Read `columns` of a gas/water time series table for a single household."""
+    query = _time_series_sql(schema, table, time_column, columns, dataid,
+                             start_time, end_time)
+    parse_dates = {time_column: {"utc": True}}
+    df = read_query(con, query, parse_dates=parse_dates,
+                    chunksize=chunksize)
+    if chunksize is not None:
+        return (_set_time_index(chunk, time_column, tz) for chunk in df)
+    return _set_time_index(df, time_column, tz)
+
+
+def _time_series_sql(schema: str,
+                     table: str,
+                     time_column: str,
+                     columns: List[str],
+                     dataid: int,
+                     start_time: Union[pd.Timestamp, str],
+                     end_time: Union[pd.Timestamp, str]) -> str:
+    """Generate the SQL used to read a gas/water time series for a household."""
+    template = """SELECT {time_column}, {columns} FROM {schema}.{table}
                   WHERE dataid={dataid} AND
-                    localminute >= '{start_time}' AND
-                    localminute < '{end_time}'
-                  ORDER BY localminute ASC;"""
-    kwargs = {"schema": schema,
+                    {time_column} >= '{start_time}' AND
+                    {time_column} < '{end_time}'
+                  ORDER BY {time_column} ASC;"""
+    kwargs = {"time_column": time_column,
+              "columns": ", ".join(columns),
+              "schema": schema,
+              "table": table,
               "dataid": dataid,
               "start_time": start_time,
-              "end_time": ert_end_time}
-    query = template.format(kwargs)
-    df = pd.read_sql_query(query, con=con, parse_dates=["localminute"])
-    df.localminute = df.localminute.dt.tz_convert(tz)
-    df.set_index("localminute", inplace=True)
-
-    return df
+              "end_time": end_time}
+    return template.format(**kwargs)
@@ -0,0 +1,169 @@
+"""
+Functions for reading electricity, gas and water data for a set of households
+from the Pecan Street Dataport in a single database round trip and returning
+them aligned on a common time index as a properly formatted Pandas DataFrame.
+
+@author : davidrpugh
+
+"""
+from typing import List, Tuple, Union
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+import sqlalchemy
+
+from . backends import read_query
+from . electricity_egauge_api import _egauge_table_kwargs
+from . utils import _to_timestamp
+
+
+UTILITIES = ("electricity", "gas", "water", "water_capstone")
+
+
+def read_household_utilities_query(con: sqlalchemy.engine.Connectable,
+                                   schema: str,
+                                   dataids: List[int],
+                                   start_time: Union[pd.Timestamp, str],
+                                   end_time: Union[pd.Timestamp, str],
+                                   utilities: Tuple[str, ...] = UTILITIES,
+                                   electricity_columns: Union[List[str], None] = None,
+                                   freq: str = "15min",
+                                   tz: str = "US/Central",
+                                   ert_lookback: str = "1 day") -> pd.DataFrame:
+    """
+    Read electricity, gas and water data for several households from a
+    database into a single `pandas.DataFrame` using one query.
+
+    Gas and water ERT meter readings are cumulative; they are converted to the
+    consumption since the previous reading in the database. All utilities are
+    then aggregated to `freq`: electricity egauge readings (in kW) are
+    averaged while gas, water ERT and water capstone consumption is summed.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the electricity egauge, `gas_ert`,
+        `water_ert` and `water_capstone` tables/views.
+    dataids : `List[int]`
+        The unique identifiers for the households.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+        Naive values are interpreted in `tz`.
+    utilities : `Tuple[str, ...]`, default: ("electricity", "gas", "water", "water_capstone")
+        Utilities to read.
+    electricity_columns : `Union[List[str], None]`, default: `None`
+        Electricity egauge circuits to read. Defaults to ["use"].
+    freq : `str`, default: "15min"
+        Frequency of the common time index. Must be a fixed frequency, such
+        as "15min", 'h' or 'D'. Electricity egauge data is read from the
+        coarsest egauge table whose frequency divides `freq`.
+    tz : `str`, default: "US/Central"
+    ert_lookback : `str`, default: "1 day"
+        SQL interval before `start_time` searched for the meter reading
+        preceding the first reading in the range, so that the consumption of
+        the first reading is also available.
+
+    Returns
+    -------
+    results_df: `pandas.DataFrame`
+
+        Data indexed by dataid and time, with one column per utility (one per
+        circuit for electricity, e.g., "electricity_use").
+
+    Raises
+    ------
+    ValueError
+        If `utilities` contains an unknown utility.
+
+    """
+    unknown = set(utilities) - set(UTILITIES)
+    if unknown:
+        raise ValueError("Unknown utilities: {}.".format(", ".join(sorted(unknown))))
+    electricity_columns = ["use"] if electricity_columns is None else electricity_columns
+    start, end = _to_timestamp(start_time, tz), _to_timestamp(end_time, tz)
+
+    output_columns = []
+    if "electricity" in utilities:
+        output_columns.extend("electricity_{}".format(column) for column in electricity_columns)
+    output_columns.extend(utility for utility in utilities if utility != "electricity")
+
+    def select(values):
+        return ", ".join("{} AS {}".format(values.get(column, "CAST(NULL AS DOUBLE PRECISION)"), column)
+                         for column in output_columns)
+
+    predicates = "dataid IN ({})".format(", ".join(str(dataid) for dataid in dataids))
+    subqueries = []
+    if "electricity" in utilities:
+        kwargs = _egauge_table_kwargs(_egauge_freq(freq))
+        values = {"electricity_{}".format(column): column for column in electricity_columns}
+        template = """SELECT dataid, {local_minute} AS reading_time, {values}
+                      FROM {schema}.{table}
+                      WHERE {predicates} AND
+                        {local_minute} >= '{start_time}' AND
+                        {local_minute} < '{end_time}'"""
+        subqueries.append(template.format(values=select(values), schema=schema,
+                                          predicates=predicates, start_time=start,
+                                          end_time=end, **kwargs))
+    for utility in ("gas", "water"):
+        if utility in utilities:
+            template = """SELECT dataid, readtime AS reading_time, {values}
+                          FROM (
+                            SELECT dataid, readtime,
+                              meter_value - LAG(meter_value) OVER (
+                                PARTITION BY dataid ORDER BY readtime) AS consumption
+                            FROM {schema}.{table}
+                            WHERE {predicates} AND
+                              readtime >= CAST('{start_time}' AS TIMESTAMP WITH TIME ZONE) - INTERVAL '{lookback}' AND
+                              readtime < '{end_time}'
+                          ) AS {table}_consumption
+                          WHERE readtime >= '{start_time}'"""
+            subqueries.append(template.format(values=select({utility: "consumption"}),
+                                              schema=schema, table="{}_ert".format(utility),
+                                              predicates=predicates, start_time=start,
+                                              end_time=end, lookback=ert_lookback))
+    if "water_capstone" in utilities:
+        template = """SELECT dataid, localminute AS reading_time, {values}
+                      FROM {schema}.water_capstone
+                      WHERE {predicates} AND
+                        localminute >= '{start_time}' AND
+                        localminute < '{end_time}'"""
+        subqueries.append(template.format(values=select({"water_capstone": "consumption"}),
+                                          schema=schema, predicates=predicates,
+                                          start_time=start, end_time=end))
+
+    query = "\nUNION ALL\n".join(subqueries) + "\nORDER BY dataid, reading_time;"
+    df = read_query(con, query, parse_dates={"reading_time": {"utc": True}})
+
+    # align all utilities on a common time index, assigning each reading to the
+    # bucket containing it; the index is built in absolute time, so the hour
+    # repeated when daylight saving time ends gives two buckets
+    times = pd.date_range(start.floor(freq, ambiguous=bool(start.dst())), end, freq=freq,
+                          inclusive="left")
+    buckets = times.searchsorted(df["reading_time"].dt.tz_convert(tz), side="right") - 1
+    df["reading_time"] = times[buckets]
+    grouped = df.groupby(["dataid", "reading_time"])
+    electricity = [column for column in output_columns if column.startswith("electricity_")]
+    consumption = [column for column in output_columns if not column.startswith("electricity_")]
+    results_df = pd.concat([grouped[electricity].mean(),
+                            grouped[consumption].sum(min_count=1)], axis=1)
+    index = pd.MultiIndex.from_product([dataids, times], names=["dataid", "reading_time"])
+    results_df = results_df.reindex(index=index, columns=output_columns)
+    return results_df
+
+
+def _egauge_freq(freq: str) -> str:
+    """
+    Return the coarsest egauge table frequency dividing `freq`, as one of the
+    'T', "15T" or 'H' keys of `_egauge_table_kwargs`.
+
+    """
+    duration = pd.Timedelta(to_offset(freq))
+    for egauge_freq, table_duration in (('H', "1h"), ("15T", "15min")):
+        if duration % pd.Timedelta(table_duration) == pd.Timedelta(0):
+            return egauge_freq
+    return 'T'
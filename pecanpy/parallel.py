@@ -0,0 +1,166 @@
+"""
+Functions for fetching and decoding electricity egauge queries in a pool of
+worker processes. Each worker writes its decoded shard into shared memory as an
+Arrow IPC stream. The parent process maps the shards without copying them and
+copies the data once, when assembling the final `pandas.DataFrame`.
+
+@author : davidrpugh
+
+"""
+from concurrent import futures
+import gc
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Tuple, Union
+
+import pandas as pd
+import sqlalchemy
+
+from . electricity_egauge_api import read_electricity_egauge_query
+from . utils import _time_windows
+
+
+_engine = None  # each worker process creates its own engine
+
+
+def read_electricity_egauge_queries(con: sqlalchemy.engine.Engine,
+                                    schema: str,
+                                    dataids: List[int],
+                                    start_time: Union[pd.Timestamp, str],
+                                    end_time: Union[pd.Timestamp, str],
+                                    columns: Union[List[str], str] = "all",
+                                    freq: str = 'T',
+                                    tz: str = "US/Central",
+                                    shard_freq: Union[str, None] = None,
+                                    max_workers: Union[int, None] = None) -> pd.DataFrame:
+    """
+    Read electricity egauge data for several households from a database into a
+    `pandas.DataFrame` using a pool of worker processes.
+
+    The requested households and time range are split into shards, one per
+    dataid and (optionally) per `shard_freq` window. Each worker fetches and
+    decodes its shards using `read_electricity_egauge_query` and returns them
+    to the parent process through shared memory as Arrow IPC streams.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Engine`
+        Engine connected to the database. Only its URL is sent to the workers,
+        each of which creates its own engine.
+    schema : `str`
+        Name of a schema containing the "electricity_egauge_minutes",
+        "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
+    dataids : `List[int]`
+        The unique identifiers for the households.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+    columns : `Union[List[str], str]`, default: "all"
+    freq : `str`, default: 'T'
+        The desired sampling frequency for the returned electricity egauge data.
+        Must be one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+    shard_freq : `Union[str, None]`, default: `None`
+        If specified, the time range for each household is further split into
+        windows of this length (e.g., "30D"), each fetched by its own worker.
+    max_workers : `Union[int, None]`, default: `None`
+        Number of worker processes. Defaults to the number of processors.
+
+    Returns
+    -------
+    results_df: `pandas.DataFrame`
+
+        Electricity egauge data for all households, indexed by dataid and
+        timestamp.
+
+    Notes
+    -----
+    Requires `pyarrow`.
+
+    """
+    import pyarrow  # fail early if the optional dependency is missing
+
+    shards = [(dataid, window_start, window_end)
+              for dataid in dataids
+              for window_start, window_end in _time_windows(start_time, end_time, shard_freq)]
+
+    with futures.ProcessPoolExecutor(max_workers, initializer=_initialize_worker,
+                                     initargs=(con.url,)) as executor:
+        pending = [executor.submit(_fetch_shard, schema, dataid, str(window_start),
+                                   str(window_end), columns, freq, tz)
+                   for dataid, window_start, window_end in shards]
+        futures.wait(pending)
+
+    # every block written by a worker must be unlinked here, even if another
+    # shard failed, as the workers unregistered them from the resource tracker
+    blocks, error = [], None
+    for future in pending:
+        try:
+            name, size = future.result()
+            blocks.append((shared_memory.SharedMemory(name=name), size))
+        except BaseException as exception:
+            error = exception if error is None else error
+    try:
+        if error is not None:
+            raise error
+        # the decoded shards are views of the shared memory, so they are
+        # copied (once) by the concatenation before the blocks are released
+        dfs = [_read_shared_memory(shm, size) for shm, size in blocks]
+        keys = [dataid for dataid, _, _ in shards]
+        results_df = pd.concat(dfs, keys=keys, names=["dataid"], copy=True)
+        del dfs
+        gc.collect()  # decoded frames may sit in reference cycles
+    finally:
+        for shm, _ in blocks:
+            shm.close()
+            shm.unlink()
+    return results_df
+
+
+def _initialize_worker(url: sqlalchemy.engine.url.URL) -> None:
+    global _engine
+    _engine = sqlalchemy.create_engine(url)
+
+
+def _fetch_shard(schema: str,
+                 dataid: int,
+                 start_time: str,
+                 end_time: str,
+                 columns: Union[List[str], str],
+                 freq: str,
+                 tz: str) -> Tuple[str, int]:
+    """Fetch and decode a single shard, returning its shared memory block."""
+    df = read_electricity_egauge_query(_engine, schema, dataid, start_time,
+                                       end_time, columns, freq, tz)
+    return _write_shared_memory(df)
+
+
+def _write_shared_memory(df: pd.DataFrame) -> Tuple[str, int]:
+    """Write `df` into a new shared memory block as an Arrow IPC stream."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df)
+    mock_sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock_sink, table.schema) as writer:
+        writer.write_table(table)
+    size = mock_sink.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    # the parent process is responsible for unlinking the block
+    resource_tracker.unregister(shm._name, "shared_memory")
+    buffer = pa.py_buffer(shm.buf)
+    sink = pa.FixedSizeBufferWriter(buffer)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    sink.close()
+    del writer, sink, buffer  # release all exports of the shared memory
+    shm.close()
+    return shm.name, size
+
+
+def _read_shared_memory(shm: shared_memory.SharedMemory, size: int) -> pd.DataFrame:
+    """Decode a shared memory block written by a worker without copying it."""
+    import pyarrow as pa
+
+    buffer = pa.py_buffer(shm.buf)[:size]
+    reader = pa.ipc.open_stream(buffer)
+    df = reader.read_all().to_pandas(split_blocks=True)
+    return df
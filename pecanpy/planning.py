@@ -0,0 +1,308 @@
+"""
+Functions for sizing reads automatically. Before fetching, the readers in this
+module ask the database how many rows a query will return (using `EXPLAIN` on
+PostgreSQL) and then split the requested time range into shards whose length
+targets a given latency, streaming each shard in chunks that fit within a
+given memory budget. Observed throughput is fed back into the shard size.
+
+@author : davidrpugh
+
+"""
+import json
+import time
+from typing import Callable, Generator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from . backends import read_query
+from . electricity_egauge_api import (_egauge_table_kwargs, _electricity_egauge_sql,
+                                      _read_electricity_egauge_query)
+from . gas_water_api import _read_time_series_query, _time_series_sql
+
+
+class AdaptiveWindowPlanner:
+    """
+    Choose shard windows and chunk sizes for time series reads.
+
+    Shards are sized so that fetching one is expected to take about
+    `target_latency` seconds given the throughput observed so far, and chunks
+    are sized so that a single chunk fits within `memory_budget` bytes. A
+    planner may be shared across reads so that throughput observed by earlier
+    reads informs later ones.
+
+    Parameters
+    ----------
+    target_latency : `float`, default: 1.0
+        Target number of seconds spent fetching each shard.
+    memory_budget : `int`, default: 256 MiB
+        Maximum number of bytes to hold in a single chunk.
+    rows_per_second : `float`, default: 100000.0
+        Initial guess of the database throughput.
+    row_width : `int`, default: 64
+        Number of bytes per row assumed when the database cannot estimate it.
+    min_window : `str`, default: "1h"
+        Shortest shard window.
+    max_window : `str`, default: "366D"
+        Longest shard window.
+    smoothing : `float`, default: 0.5
+        Weight given to the latest observation when updating estimates.
+
+    """
+
+    def __init__(self,
+                 target_latency: float = 1.0,
+                 memory_budget: int = 2**28,
+                 rows_per_second: float = 1e5,
+                 row_width: int = 64,
+                 min_window: str = "1h",
+                 max_window: str = "366D",
+                 smoothing: float = 0.5):
+        self.target_latency = target_latency
+        self.memory_budget = memory_budget
+        self.rows_per_second = rows_per_second
+        self.row_width = row_width
+        self.min_window = pd.Timedelta(min_window)
+        self.max_window = pd.Timedelta(max_window)
+        self.smoothing = smoothing
+
+    def chunksize(self, row_width: Union[int, None] = None) -> int:
+        """Number of rows per chunk that fits within the memory budget."""
+        row_width = self.row_width if row_width is None else max(row_width, 1)
+        return max(1, int(self.memory_budget // row_width))
+
+    def window(self, rows_per_data_second: float) -> pd.Timedelta:
+        """Shard window expected to take `target_latency` seconds to fetch."""
+        target_rows = self.target_latency * self.rows_per_second
+        seconds = min(target_rows / max(rows_per_data_second, 1e-9),
+                      self.max_window.total_seconds())
+        return max(pd.Timedelta(seconds=seconds), self.min_window)
+
+    def observe(self, rows: int, seconds: float) -> None:
+        """Update the throughput estimate after fetching a shard."""
+        if rows > 0 and seconds > 0:
+            self.rows_per_second = _smooth(self.rows_per_second, rows / seconds,
+                                           self.smoothing)
+
+
+def estimate_query_rows(con: sqlalchemy.engine.Connectable,
+                        query: str,
+                        params=None) -> Tuple[float, Union[int, None]]:
+    """
+    Estimate the number of rows, and their width in bytes, returned by a query.
+
+    On PostgreSQL the number of rows is read from the planner using `EXPLAIN`,
+    which does not execute the query. Other backends, including DuckDB (whose
+    planner ignores the selectivity of most predicates, while scans of local
+    columnar files are cheap), count the rows instead, which executes the
+    query in full, so it is run twice by readers that go on to fetch it. The
+    row width is read from the PostgreSQL planner
+    and is otherwise measured on the first rows of the result as loaded into
+    pandas.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    query : `str`
+        SQL select query.
+    params : `list, tuple or dict`, optional
+        Parameters of the query, see `pandas.read_sql_query`.
+
+    Returns
+    -------
+    (rows, width): `Tuple[float, Union[int, None]]`
+
+        Estimated number of rows and row width (`None` if the result is
+        empty).
+
+    """
+    if _is_postgresql(con):
+        plan = _explain(con, query, "FORMAT JSON", params)["Plan"]
+        return float(plan["Plan Rows"]), int(plan["Plan Width"])
+
+    template = "SELECT COUNT(*) AS n FROM ({}) AS q;"
+    df = read_query(con, template.format(query.strip().rstrip(';')), params=params)
+    return float(df.iloc[0, 0]), _sample_row_width(con, query, params)
+
+
+def read_electricity_egauge_query_adaptive(con: sqlalchemy.engine.Connectable,
+                                           schema: str,
+                                           dataid: int,
+                                           start_time: Union[pd.Timestamp, str],
+                                           end_time: Union[pd.Timestamp, str],
+                                           columns: Union[List[str], str] = "all",
+                                           freq: str = 'T',
+                                           tz: str = "US/Central",
+                                           planner: Union[AdaptiveWindowPlanner, None] = None) -> Generator:
+    """
+    Read electricity egauge data in adaptively sized shards and chunks.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the "electricity_egauge_minutes",
+        "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
+    dataid : `int`
+        The unique identifier for a particular household.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+    columns : `Union[List[str], str]`, default: "all"
+    freq : `str`, default: 'T'
+        The desired sampling frequency for the returned electricity egauge data.
+        Must be one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+    planner : `Union[AdaptiveWindowPlanner, None]`, default: `None`
+        Planner used to size shards and chunks. Defaults to a new
+        `AdaptiveWindowPlanner` with default settings.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Consecutive chunks of electricity egauge data for a particular household.
+
+    Raises
+    ------
+    ValueError
+        If `freq` is not one of 'T', "15T", or 'H'.
+
+    Notes
+    -----
+    The number of rows is estimated with `estimate_query_rows` before any data
+    is read. On backends other than PostgreSQL (including DuckDB) this executes
+    the whole query once more.
+
+    """
+    kwargs = {"schema": schema, "dataid": dataid, "columns": columns}
+    kwargs.update(_egauge_table_kwargs(freq))
+
+    def build_query(start, end):
+        return _electricity_egauge_sql(start_time=start, end_time=end, **kwargs)
+
+    def read_shard(start, end, chunksize):
+        return _read_electricity_egauge_query(con, start_time=start, end_time=end,
+                                              tz=tz, chunksize=chunksize, **kwargs)
+
+    return _read_adaptive(con, build_query, read_shard, start_time, end_time, planner)
+
+
+def read_gas_ert_query_adaptive(con: sqlalchemy.engine.Connectable,
+                                schema: str,
+                                dataid: int,
+                                start_time: Union[pd.Timestamp, str],
+                                end_time: Union[pd.Timestamp, str],
+                                tz: str = "US/Central",
+                                planner: Union[AdaptiveWindowPlanner, None] = None) -> Generator:
+    """
+    Read gas ERT data in adaptively sized shards and chunks.
+
+    See `read_electricity_egauge_query_adaptive` for a description of the
+    parameters.
+
+    """
+    return _read_ert_adaptive(con, schema, "gas_ert", dataid, start_time,
+                              end_time, tz, planner)
+
+
+def read_water_ert_query_adaptive(con: sqlalchemy.engine.Connectable,
+                                  schema: str,
+                                  dataid: int,
+                                  start_time: Union[pd.Timestamp, str],
+                                  end_time: Union[pd.Timestamp, str],
+                                  tz: str = "US/Central",
+                                  planner: Union[AdaptiveWindowPlanner, None] = None) -> Generator:
+    """
+    Read water ERT data in adaptively sized shards and chunks.
+
+    See `read_electricity_egauge_query_adaptive` for a description of the
+    parameters.
+
+    """
+    return _read_ert_adaptive(con, schema, "water_ert", dataid, start_time,
+                              end_time, tz, planner)
+
+
+def _read_ert_adaptive(con, schema, table, dataid, start_time, end_time, tz,
+                       planner) -> Generator:
+    kwargs = {"schema": schema, "table": table, "time_column": "readtime",
+              "columns": ["meter_value"], "dataid": dataid}
+
+    def build_query(start, end):
+        return _time_series_sql(start_time=start, end_time=end, **kwargs)
+
+    def read_shard(start, end, chunksize):
+        return _read_time_series_query(con, start_time=start, end_time=end,
+                                       tz=tz, chunksize=chunksize, **kwargs)
+
+    return _read_adaptive(con, build_query, read_shard, start_time, end_time, planner)
+
+
+def _read_adaptive(con: sqlalchemy.engine.Connectable,
+                   build_query: Callable[[pd.Timestamp, pd.Timestamp], str],
+                   read_shard: Callable[[pd.Timestamp, pd.Timestamp, int], Generator],
+                   start_time: Union[pd.Timestamp, str],
+                   end_time: Union[pd.Timestamp, str],
+                   planner: Union[AdaptiveWindowPlanner, None]) -> Generator:
+    planner = AdaptiveWindowPlanner() if planner is None else planner
+    start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+    rows, row_width = estimate_query_rows(con, build_query(start, end))
+    chunksize = planner.chunksize(row_width)
+    density = rows / max((end - start).total_seconds(), 1.0)
+
+    while start < end:
+        window = planner.window(density)
+        shard_end = min(start + window, end)
+        shard_rows, elapsed = 0, 0.0
+        chunks = read_shard(start, shard_end, chunksize)
+        while True:
+            began = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - began
+            if chunk is None:
+                break
+            shard_rows += len(chunk)
+            yield chunk
+        planner.observe(shard_rows, elapsed)
+        observed_density = shard_rows / (shard_end - start).total_seconds()
+        density = _smooth(density, observed_density, planner.smoothing)
+        start = shard_end
+
+
+def _explain(con: sqlalchemy.engine.Connectable, query: str, options: str, params=None) -> dict:
+    """Run `EXPLAIN (options)` on a PostgreSQL query, returning the JSON plan."""
+    df = read_query(con, "EXPLAIN ({}) {}".format(options, query), params=params)
+    plan = df.iloc[0, 0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def _sample_row_width(con: sqlalchemy.engine.Connectable,
+                      query: str,
+                      params=None,
+                      rows: int = 100) -> Union[int, None]:
+    """Average number of bytes taken in pandas by the first rows of the result of a query."""
+    template = "SELECT * FROM ({}) AS q LIMIT {};"
+    df = read_query(con, template.format(query.strip().rstrip(';'), rows), params=params)
+    if len(df) == 0:
+        return None
+    return int(np.ceil(df.memory_usage(deep=True, index=False).sum() / len(df)))
+
+
+def _is_postgresql(con) -> bool:
+    dialect = getattr(con, "dialect", None)
+    return getattr(dialect, "name", None) == "postgresql"
+
+
+def _smooth(previous: float, latest: float, weight: float) -> float:
+    return weight * latest + (1 - weight) * previous
@@ -0,0 +1,180 @@
+"""
+Functions for building and querying a local multi-resolution pyramid of
+rollups of electricity egauge data. A pyramid is built once from a single
+fetch of minute-level data and stores, for each level (e.g., "min", "15min",
+'h', 'D' and 'W'), the sum, mean, min, max and count of every circuit using the
+household store in `pecanpy.store`. Queries at any resolution are then
+answered from the coarsest suitable level without going back to the database.
+
+Rollups are laid out as "<directory>/<level>/<agg>/<dataid>.arrow".
+
+@author : davidrpugh
+
+"""
+import os
+from typing import List, Tuple, Union
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from . store import read_household_store, write_household_store
+from . utils import _to_timestamp
+
+
+LEVELS = ("min", "15min", 'h', 'D', 'W')
+
+AGGREGATIONS = ("sum", "mean", "min", "max")
+
+
+def build_rollup_pyramid(df: pd.DataFrame,
+                         directory: str,
+                         dataid: int,
+                         levels: Tuple[str, ...] = LEVELS,
+                         columns: Union[List[str], None] = None) -> None:
+    """
+    Materialise rollups of a household's electricity egauge data on disk.
+
+    Parameters
+    ----------
+    df : `pandas.DataFrame`
+        Electricity egauge data for a particular household, indexed by
+        timestamp, at the resolution of the finest level or finer.
+    directory : `str`
+        Root directory of the pyramid.
+    dataid : `int`
+        The unique identifier for the household.
+    levels : `Tuple[str, ...]`, default: ("min", "15min", 'h', 'D', 'W')
+        Resolutions to materialise.
+    columns : `Union[List[str], None]`, default: `None`
+        Circuits to roll up. Defaults to all numeric columns other than dataid.
+
+    Notes
+    -----
+    Requires `pyarrow`.
+
+    """
+    if columns is None:
+        columns = [column for column in df.select_dtypes("number").columns
+                   if column != "dataid"]
+    df = df[columns]
+    for level in levels:
+        resampler = df.resample(level)
+        for agg in AGGREGATIONS + ("count",):
+            rollup = getattr(resampler, agg)()
+            write_household_store(rollup, directory, os.path.join(level, agg), dataid)
+
+
+def read_rollup_pyramid(directory: str,
+                        dataid: int,
+                        start_time: Union[pd.Timestamp, str],
+                        end_time: Union[pd.Timestamp, str],
+                        freq: str,
+                        agg: str = "mean",
+                        columns: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    Read rolled up electricity egauge data for a household at any resolution.
+
+    The query is answered from the stored level with the same frequency as
+    `freq` (a weekly level only answers queries with the same anchor) or else
+    by re-aggregating the coarsest stored level whose buckets evenly divide
+    those of `freq` and share their edges. Only levels whose buckets evenly
+    divide a day are re-aggregated, as their edges fall on every midnight.
+    Stored buckets are selected by their label, so buckets straddling
+    `start_time` or `end_time` are either included whole or not at all.
+
+    Parameters
+    ----------
+    directory : `str`
+        Root directory of the pyramid.
+    dataid : `int`
+        The unique identifier for the household.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+        Naive values are interpreted in the time zone of the stored data.
+    freq : `str`
+        The desired resolution, e.g., "15min", "4h", 'D', 'W' or 'M'.
+    agg : `str`, default: "mean"
+        One of "sum", "mean", "min", "max" or "count".
+    columns : `Union[List[str], None]`, default: `None`
+        Circuits to read. Defaults to all circuits.
+
+    Returns
+    -------
+    df: `pandas.DataFrame`
+
+        Rolled up data for the household, indexed by timestamp.
+
+    Raises
+    ------
+    ValueError
+        If `agg` is not supported or no stored level can answer the query.
+
+    """
+    if agg not in AGGREGATIONS + ("count",):
+        raise ValueError("The 'agg' keyword argument must be one of 'sum', 'mean', "
+                         "'min', 'max' or 'count'.")
+    level = _coarsest_level(directory, dataid, freq)
+
+    def read(level_agg):
+        df = read_household_store(directory, os.path.join(level, level_agg), dataid, columns)
+        return _slice(df, start_time, end_time)
+
+    if _offset(level) == to_offset(freq):
+        return read(agg)
+    elif agg == "mean":
+        return read("sum").resample(freq).sum() / read("count").resample(freq).sum()
+    elif agg == "count":
+        return read("count").resample(freq).sum()
+    else:
+        return getattr(read(agg).resample(freq), agg)()
+
+
+def _coarsest_level(directory: str, dataid: int, freq: str) -> str:
+    """
+    Return the stored level with the same frequency as `freq` or else the
+    coarsest stored level that can be re-aggregated to `freq`.
+
+    """
+    target = to_offset(freq)
+    levels = os.listdir(directory) if os.path.isdir(directory) else []
+    candidates = []
+    for level in levels:
+        path = os.path.join(directory, level, "count", "{}.arrow".format(dataid))
+        offset = _offset(level)
+        if not os.path.exists(path) or offset is None:
+            continue
+        if offset == target:
+            return level
+        if _aligns(offset, target):
+            candidates.append((pd.Timedelta(offset), level))
+    if not candidates:
+        raise ValueError("No stored level can be aggregated to '{}'.".format(freq))
+    return max(candidates)[1]
+
+
+def _aligns(level: pd.DateOffset, target: pd.DateOffset) -> bool:
+    """Whether the buckets of `level` evenly divide those of `target` and share their edges."""
+    day = pd.Timedelta(days=1)
+    if not isinstance(level, pd.offsets.Tick) or day % pd.Timedelta(level) != pd.Timedelta(0):
+        return False
+    if isinstance(target, pd.offsets.Tick):
+        # fixed frequencies are binned from midnight of the first day
+        return pd.Timedelta(target) % pd.Timedelta(level) == pd.Timedelta(0)
+    return True  # calendar and weekly frequencies are made of whole days
+
+
+def _offset(level: str) -> Union[pd.DateOffset, None]:
+    """Frequency of a stored level, `None` if the directory is not a level."""
+    try:
+        return to_offset(level)
+    except ValueError:
+        return None
+
+
+def _slice(df: pd.DataFrame,
+           start_time: Union[pd.Timestamp, str],
+           end_time: Union[pd.Timestamp, str]) -> pd.DataFrame:
+    tz = str(df.index.tz)
+    start = df.index.searchsorted(_to_timestamp(start_time, tz))
+    end = df.index.searchsorted(_to_timestamp(end_time, tz))
+    return df.iloc[start:end]
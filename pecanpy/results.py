@@ -0,0 +1,155 @@
+"""
+Functions for executing reads within a memory budget. The size of the result
+of a query is estimated before it is fetched (see `estimate_query_rows`) and,
+if the materialised `pandas.DataFrame` would not fit within the budget, the
+result is streamed in chunks or spilled to a Parquet file on disk instead. The
+result is returned through a `QueryResult` handle whichever way it was
+fetched.
+
+@author : davidrpugh
+
+"""
+import os
+import tempfile
+from typing import Callable, Generator, Iterable, Union
+
+import pandas as pd
+import sqlalchemy
+
+from . planning import AdaptiveWindowPlanner, estimate_query_rows
+
+
+class QueryResult:
+    """
+    Handle on the result of a read executed within a memory budget.
+
+    Parameters
+    ----------
+    mode : `str`
+        One of "memory" (the result is held as a `pandas.DataFrame`),
+        "chunks" (the result is streamed from the database, and can only be
+        iterated over once) or "spill" (the result is stored in a Parquet
+        file).
+    estimated_bytes : `float`
+        Estimated size of the materialised result.
+    frame : `Union[pandas.DataFrame, None]`, default: `None`
+        The result, if `mode` is "memory".
+    chunks : `Union[Iterable[pandas.DataFrame], None]`, default: `None`
+        The chunks of the result, if `mode` is "chunks".
+    path : `Union[str, None]`, default: `None`
+        Path of the Parquet file holding the result, if `mode` is "spill".
+
+    """
+
+    def __init__(self,
+                 mode: str,
+                 estimated_bytes: float,
+                 frame: Union[pd.DataFrame, None] = None,
+                 chunks: Union[Iterable[pd.DataFrame], None] = None,
+                 path: Union[str, None] = None):
+        self.mode = mode
+        self.estimated_bytes = estimated_bytes
+        self.path = path
+        self._frame = frame
+        self._chunks = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Materialise the whole result as a `pandas.DataFrame`, regardless of
+        the memory budget.
+
+        """
+        if self.mode == "memory":
+            return self._frame
+        elif self.mode == "chunks":
+            return pd.concat(self.iter_chunks())
+        else:
+            return pd.read_parquet(self.path, memory_map=True)
+
+    def iter_chunks(self) -> Generator:
+        """Iterate over the result in chunks that fit within the memory budget."""
+        if self.mode == "memory":
+            yield self._frame
+        elif self.mode == "chunks":
+            if self._chunks is None:
+                raise ValueError("The chunks of this result have already been consumed.")
+            chunks, self._chunks = self._chunks, None
+            yield from chunks
+        else:
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(self.path, memory_map=True)
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i).to_pandas()
+
+    def close(self) -> None:
+        """Release the result, deleting any spill file."""
+        self._frame, self._chunks = None, None
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _read_with_budget(con: sqlalchemy.engine.Connectable,
+                      query: str,
+                      read: Callable[[Union[int, None]], Union[pd.DataFrame, Generator]],
+                      memory_budget: int,
+                      spill_directory: Union[str, None],
+                      params=None) -> QueryResult:
+    """
+    Estimate the size of the result of `query` and fetch it with `read`,
+    either whole (`read(None)`) or in chunks (`read(chunksize)`), accordingly.
+
+    """
+    rows, row_width = estimate_query_rows(con, query, params)
+    planner = AdaptiveWindowPlanner(memory_budget=memory_budget)
+    row_width = planner.row_width if row_width is None else row_width
+    estimated_bytes = rows * row_width
+    if estimated_bytes <= memory_budget:
+        return QueryResult("memory", estimated_bytes, frame=read(None))
+
+    chunks = read(planner.chunksize(row_width))
+    if spill_directory is None:
+        return QueryResult("chunks", estimated_bytes, chunks=chunks)
+    path = _spill(chunks, spill_directory)
+    return QueryResult("spill", estimated_bytes, path=path)
+
+
+def _spill(chunks: Iterable[pd.DataFrame], directory: str) -> str:
+    """Write chunks to a Parquet file in `directory`, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(suffix=".parquet", dir=directory)
+    os.close(descriptor)
+    try:
+        writer = None
+        try:
+            for chunk in chunks:
+                # a default index is not stored, as each chunk restarts it at 0
+                preserve_index = not isinstance(chunk.index, pd.RangeIndex)
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=preserve_index)
+                    writer = pq.ParquetWriter(path, table.schema)
+                else:
+                    table = pa.Table.from_pandas(chunk, schema=writer.schema,
+                                                 preserve_index=preserve_index)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:  # empty result
+            pq.write_table(pa.table({}), path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
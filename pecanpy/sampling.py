@@ -0,0 +1,261 @@
+"""
+Functions for reading reproducible random samples of households and days.
+Households and local days are drawn using a seeded hash of the dataid or of the
+local day number, and the sampled dataids and days are sent to the database as
+lists, so the cost of a sampled read scales with the size of the sample rather
+than with the size of the dataset.
+
+@author : davidrpugh
+
+"""
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from . backends import read_query
+from . electricity_egauge_api import _egauge_table_kwargs
+from . utils import _to_timestamp
+
+
+_HASH_MODULUS = 2**32
+
+
+def read_sampled_dataids(con: sqlalchemy.engine.Connectable,
+                         schema: str,
+                         fraction: float,
+                         strata: Union[List[str], None] = None,
+                         seed: int = 0) -> List[int]:
+    """
+    Draw a reproducible random sample of households from the metadata table.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the `metadata` table/view.
+    fraction : `float`
+        Fraction of households to sample (rounded up within each stratum).
+    strata : `Union[List[str], None]`, default: `None`
+        Metadata columns (e.g., ["city", "pv"]) defining the strata. If
+        specified, `fraction` of the households in each stratum is sampled.
+    seed : `int`, default: 0
+
+    Returns
+    -------
+    dataids: `List[int]`
+
+        Sorted unique identifiers of the sampled households.
+
+    """
+    strata = list(strata) if strata else []
+    query = "SELECT {} FROM {}.metadata;".format(", ".join(["dataid"] + strata), schema)
+    df = read_query(con, query)
+    groups = df.groupby(strata, dropna=False)["dataid"] if strata else [(None, df["dataid"])]
+    dataids = [int(dataid)
+               for _, values in groups
+               for dataid in _sample(values.to_numpy(), fraction, seed)]
+    return sorted(dataids)
+
+
+def read_electricity_egauge_sample(con: sqlalchemy.engine.Connectable,
+                                   schema: str,
+                                   start_time: Union[pd.Timestamp, str],
+                                   end_time: Union[pd.Timestamp, str],
+                                   dataids: Union[List[int], None] = None,
+                                   columns: Union[List[str], str] = "all",
+                                   freq: str = 'T',
+                                   tz: str = "US/Central",
+                                   household_fraction: Union[float, None] = None,
+                                   day_fraction: Union[float, None] = None,
+                                   day_step: Union[int, None] = None,
+                                   seed: int = 0) -> pd.DataFrame:
+    """
+    Read a sample of electricity egauge data from a database into a
+    `pandas.DataFrame`.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of a schema containing the "electricity_egauge_minutes",
+        "electricity_egauge_15min" and "electricity_egauge_hours" tables/views.
+    start_time : `Union[pd.Timestamp, str]`
+    end_time : `Union[pd.Timestamp, str]`
+    dataids : `Union[List[int], None]`, default: `None`
+        Households to read (e.g., from `read_sampled_dataids`). Defaults to
+        all households.
+    columns : `Union[List[str], str]`, default: "all"
+    freq : `str`, default: 'T'
+        The desired sampling frequency for the returned electricity egauge data.
+        Must be one of 'T' (minutes), "15T" (15-minute), or 'H' (hourly).
+    tz : `str`, default: "US/Central"
+    household_fraction : `Union[float, None]`, default: `None`
+        If specified, only read this fraction (rounded up) of `dataids`, or of
+        all households (see `read_sampled_dataids`).
+    day_fraction : `Union[float, None]`, default: `None`
+        If specified, only read a random subsample of this fraction (rounded
+        up) of the local days between `start_time` and `end_time`.
+    day_step : `Union[int, None]`, default: `None`
+        If specified, only read every `day_step`-th local day.
+    seed : `int`, default: 0
+
+    Returns
+    -------
+    results_df: `pandas.DataFrame`
+
+        Electricity egauge data indexed by dataid and timestamp.
+
+    Raises
+    ------
+    ValueError
+        If `freq` is not one of 'T', "15T", or 'H'.
+
+    """
+    kwargs = _egauge_table_kwargs(freq)
+    columns = columns if columns == "all" else ["dataid"] + columns
+    return _read_sample(con, schema, kwargs["table"], kwargs["local_minute"], columns,
+                        start_time, end_time, dataids, tz, household_fraction,
+                        day_fraction, day_step, seed)
+
+
+def read_gas_ert_sample(con: sqlalchemy.engine.Connectable,
+                        schema: str,
+                        start_time: Union[pd.Timestamp, str],
+                        end_time: Union[pd.Timestamp, str],
+                        dataids: Union[List[int], None] = None,
+                        tz: str = "US/Central",
+                        household_fraction: Union[float, None] = None,
+                        day_fraction: Union[float, None] = None,
+                        day_step: Union[int, None] = None,
+                        seed: int = 0) -> pd.DataFrame:
+    """
+    Read a sample of gas ERT data from a database into a `pandas.DataFrame`.
+
+    See `read_electricity_egauge_sample` for a description of the parameters.
+
+    """
+    return _read_sample(con, schema, "gas_ert", "readtime", ["dataid", "meter_value"],
+                        start_time, end_time, dataids, tz, household_fraction,
+                        day_fraction, day_step, seed)
+
+
+def read_water_ert_sample(con: sqlalchemy.engine.Connectable,
+                          schema: str,
+                          start_time: Union[pd.Timestamp, str],
+                          end_time: Union[pd.Timestamp, str],
+                          dataids: Union[List[int], None] = None,
+                          tz: str = "US/Central",
+                          household_fraction: Union[float, None] = None,
+                          day_fraction: Union[float, None] = None,
+                          day_step: Union[int, None] = None,
+                          seed: int = 0) -> pd.DataFrame:
+    """
+    Read a sample of water ERT data from a database into a `pandas.DataFrame`.
+
+    See `read_electricity_egauge_sample` for a description of the parameters.
+
+    """
+    return _read_sample(con, schema, "water_ert", "readtime", ["dataid", "meter_value"],
+                        start_time, end_time, dataids, tz, household_fraction,
+                        day_fraction, day_step, seed)
+
+
+def _read_sample(con: sqlalchemy.engine.Connectable,
+                 schema: str,
+                 table: str,
+                 time_column: str,
+                 columns: Union[List[str], str],
+                 start_time: Union[pd.Timestamp, str],
+                 end_time: Union[pd.Timestamp, str],
+                 dataids: Union[List[int], None],
+                 tz: str,
+                 household_fraction: Union[float, None],
+                 day_fraction: Union[float, None],
+                 day_step: Union[int, None],
+                 seed: int) -> pd.DataFrame:
+    predicates = ["{} >= '{}'".format(time_column, start_time),
+                  "{} < '{}'".format(time_column, end_time)]
+    if household_fraction is not None:
+        if dataids is None:
+            dataids = read_sampled_dataids(con, schema, household_fraction, seed=seed)
+        else:
+            dataids = _sample(np.asarray(dataids), household_fraction, seed).tolist()
+    if dataids is not None:
+        predicates.append(_in_sql("dataid", dataids))
+    if day_fraction is not None or day_step is not None:
+        start = _to_timestamp(start_time, tz).tz_localize(None).normalize()
+        end = _to_timestamp(end_time, tz).tz_localize(None)
+        days = pd.date_range(start, end, freq='D', inclusive="left")
+        day_numbers = (days - pd.Timestamp(0)).days.to_numpy()
+        if day_fraction is not None:
+            day_numbers = np.sort(_sample(day_numbers, day_fraction, seed))
+        if day_step is not None:
+            day_numbers = day_numbers[day_numbers % day_step == seed % day_step]
+        predicates.append(_day_ranges_sql(time_column, day_numbers, tz))
+
+    template = """SELECT {columns} FROM {schema}.{table}
+                  WHERE {predicates}
+                  ORDER BY dataid, {time_column} ASC;"""
+    kwargs = {"columns": '*' if columns == "all" else ", ".join([time_column] + columns),
+              "schema": schema,
+              "table": table,
+              "predicates": " AND\n".join(predicates),
+              "time_column": time_column}
+    query = template.format(**kwargs)
+    parse_dates = {time_column: {"utc": True}}
+    df = read_query(con, query, parse_dates=parse_dates)
+    df[time_column] = df[time_column].dt.tz_convert(tz)
+    df.set_index(["dataid", time_column], inplace=True)
+    return df
+
+
+def _hash(values: np.ndarray, seed: int) -> np.ndarray:
+    """
+    Seeded hash of non-negative integers into [0, 2**32). The seed is added to
+    the key, which is then mixed by two rounds of xor-shift and multiplication.
+
+    """
+    keys = (values.astype(np.uint64) + np.uint64(seed * 2246822519 % _HASH_MODULUS)) % np.uint64(_HASH_MODULUS)
+    for _ in range(2):
+        keys = ((keys ^ (keys >> np.uint64(16))) * np.uint64(73244475)) % np.uint64(_HASH_MODULUS)
+    return keys ^ (keys >> np.uint64(16))
+
+
+def _sample(values: np.ndarray, fraction: float, seed: int) -> np.ndarray:
+    """The `fraction` (rounded up) of `values` with the smallest hashes."""
+    order = np.lexsort((values, _hash(values, seed)))
+    return values[order[:int(np.ceil(fraction * len(values)))]]
+
+
+def _day_ranges_sql(time_column: str, day_numbers: np.ndarray, tz: str) -> str:
+    """
+    Predicate selecting the local days `day_numbers` (days since 1970-01-01 in
+    `tz`) as half-open ranges of `time_column`, so that an index on it can be
+    used. Consecutive days are merged into a single range.
+
+    """
+    if len(day_numbers) == 0:
+        return "1 = 0"
+    breaks = np.flatnonzero(np.diff(day_numbers) != 1) + 1
+    ranges = []
+    for run in np.split(day_numbers, breaks):
+        start, end = (pd.Timestamp(0) + pd.Timedelta(days=int(day)) for day in (run[0], run[-1] + 1))
+        ranges.append("{0} >= '{1}' AND {0} < '{2}'".format(time_column, start.tz_localize(tz),
+                                                           end.tz_localize(tz)))
+    return "({})".format(" OR\n".join("({})".format(r) for r in ranges))
+
+
+def _in_sql(expression: str, values: List[int]) -> str:
+    if not values:
+        return "1 = 0"
+    return "{} IN ({})".format(expression, ", ".join(str(value) for value in values))
@@ -0,0 +1,134 @@
+"""
+Functions for persisting reader output as uncompressed Arrow IPC (Feather v2)
+files, one per household, and for reopening them as memory-mapped,
+zero-copy `pandas.DataFrame` instances. Processes reading the same household
+therefore share a single copy of the data in the page cache.
+
+Files are laid out as "<directory>/<table>/<dataid>.arrow", where `table` is
+the name of the source table (e.g., "electricity_egauge_minutes", "gas_ert",
+"water_ert" or "water_capstone"). The time zone aware index and the column
+dtypes are stored in the file's pandas metadata.
+
+@author : davidrpugh
+
+"""
+import os
+from typing import List, Union
+
+import pandas as pd
+from pandas.api import types
+
+
+def write_household_store(df: pd.DataFrame,
+                          directory: str,
+                          table: str,
+                          dataid: Union[int, None] = None) -> List[str]:
+    """
+    Write reader output to per-household Arrow IPC files.
+
+    Parameters
+    ----------
+    df : `pandas.DataFrame`
+        Data returned by a reader, either for a single household (indexed by
+        timestamp) or for several households (indexed by dataid and timestamp).
+    directory : `str`
+        Root directory of the store.
+    table : `str`
+        Name of the source table, e.g., "electricity_egauge_minutes".
+    dataid : `Union[int, None]`, default: `None`
+        The unique identifier of the household. Must be specified if, and only
+        if, `df` holds data for a single household.
+
+    Returns
+    -------
+    paths: `List[str]`
+
+        Paths of the files written.
+
+    Notes
+    -----
+    Requires `pyarrow`.
+
+    """
+    if dataid is None:
+        return [path
+                for household_dataid, household_df in df.groupby(level="dataid", sort=False)
+                for path in write_household_store(household_df.droplevel("dataid"),
+                                                  directory, table, household_dataid)]
+
+    import pyarrow as pa
+
+    arrow_table = pa.Table.from_pandas(df, preserve_index=True)
+    for i, field in enumerate(arrow_table.schema):
+        # keep NaN as a value rather than a null, so that reads can be zero-copy
+        if field.name in df.columns and types.is_float_dtype(df[field.name]):
+            values = pa.array(df[field.name].to_numpy(), type=field.type, from_pandas=False)
+            arrow_table = arrow_table.set_column(i, field, values)
+
+    path = _household_path(directory, table, dataid)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with pa.OSFile(temp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    os.replace(temp_path, path)  # readers never see a partially written file
+    return [path]
+
+
+def read_household_store(directory: str,
+                         table: str,
+                         dataid: int,
+                         columns: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    Memory-map a household's Arrow IPC file into a `pandas.DataFrame`.
+
+    Columns without missing values (other than NaN) are zero-copy, read-only
+    views of the memory-mapped file.
+
+    Parameters
+    ----------
+    directory : `str`
+        Root directory of the store.
+    table : `str`
+        Name of the source table, e.g., "electricity_egauge_minutes".
+    dataid : `int`
+        The unique identifier of the household.
+    columns : `Union[List[str], None]`, default: `None`
+        Columns to read. Defaults to all columns.
+
+    Returns
+    -------
+    df: `pandas.DataFrame`
+
+        Data for the household, indexed by timestamp.
+
+    Notes
+    -----
+    Requires `pyarrow`.
+
+    """
+    import pyarrow as pa
+
+    source = pa.memory_map(_household_path(directory, table, dataid), "r")
+    arrow_table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        index_columns = [column for column in arrow_table.schema.pandas_metadata["index_columns"]
+                         if isinstance(column, str)]
+        arrow_table = arrow_table.select(index_columns + columns)
+    df = arrow_table.to_pandas(split_blocks=True)
+    return df
+
+
+def list_household_store(directory: str, table: str) -> List[int]:
+    """Return the sorted dataids of the households stored for `table`."""
+    table_directory = os.path.join(directory, table)
+    if not os.path.isdir(table_directory):
+        return []
+    dataids = [int(os.path.splitext(filename)[0])
+               for filename in os.listdir(table_directory)
+               if filename.endswith(".arrow")]
+    return sorted(dataids)
+
+
+def _household_path(directory: str, table: str, dataid: int) -> str:
+    return os.path.join(directory, table, "{}.arrow".format(dataid))
@@ -0,0 +1,202 @@
+"""
+Stateful operators for processing time series returned in chunks by the
+readers (i.e., when called with `chunksize`). Each operator consumes an
+iterable of `pandas.DataFrame` chunks and returns a generator of transformed
+chunks, carrying whatever state is needed across chunk boundaries so that the
+concatenated output matches the result of applying the equivalent `pandas`
+operation to the whole series in memory.
+
+Operators can be chained, for example...
+
+    chunks = read_gas_ert_query(con, schema, dataid, start_time, end_time,
+                                chunksize=100000)
+    for chunk in resample(consumption_from_cumulative(chunks), 'H', how="sum"):
+        ...
+
+@author : davidrpugh
+
+"""
+from typing import Generator, Iterable, Union
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+def diff(chunks: Iterable[pd.DataFrame],
+         periods: int = 1) -> Generator:
+    """
+    Streaming equivalent of `pandas.DataFrame.diff`.
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of a time series.
+    periods : `int`, default: 1
+        Periods to shift for calculating the difference.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Differenced chunks.
+
+    """
+    history = None
+    for chunk in chunks:
+        combined = chunk if history is None else pd.concat([history, chunk])
+        yield combined.diff(periods).iloc[len(combined) - len(chunk):]
+        history = combined.iloc[-periods:]
+
+
+def consumption_from_cumulative(chunks: Iterable[pd.DataFrame],
+                                column: str = "meter_value") -> Generator:
+    """
+    Convert cumulative meter readings into consumption between readings.
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of gas or water ERT data.
+    column : `str`, default: "meter_value"
+        Column holding the cumulative meter readings.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Chunks with a single "consumption" column. The consumption for the
+        very first reading is missing.
+
+    """
+    for chunk in diff(chunk[[column]] for chunk in chunks):
+        yield chunk.rename(columns={column: "consumption"})
+
+
+def rolling(chunks: Iterable[pd.DataFrame],
+            window: Union[int, str],
+            how: str = "mean",
+            min_periods: Union[int, None] = None) -> Generator:
+    """
+    Streaming equivalent of `pandas.DataFrame.rolling`.
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of a time series.
+    window : `Union[int, str]`
+        Either a number of observations or a time offset (e.g., "15T").
+    how : `str`, default: "mean"
+        Name of the rolling aggregation, e.g., "mean" or "sum".
+    min_periods : `Union[int, None]`, default: `None`
+        See `pandas.DataFrame.rolling`.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Chunks of rolling aggregates.
+
+    """
+    history = None
+    for chunk in chunks:
+        combined = chunk if history is None else pd.concat([history, chunk])
+        rolled = combined.rolling(window, min_periods=min_periods)
+        yield getattr(rolled, how)().iloc[len(combined) - len(chunk):]
+        if isinstance(window, int):
+            history = combined.iloc[max(0, len(combined) - (window - 1)):]
+        elif not combined.empty:
+            cutoff = combined.index[-1] - to_offset(window)
+            history = combined[combined.index > cutoff]
+
+
+def resample(chunks: Iterable[pd.DataFrame],
+             rule: str,
+             how: str = "mean") -> Generator:
+    """
+    Streaming equivalent of `pandas.DataFrame.resample`.
+
+    Observations belonging to the last (possibly incomplete) bucket of each
+    chunk are held back until the following chunk has been seen. Empty
+    buckets between observations are emitted, as they are in memory.
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of a time series.
+    rule : `str`
+        Target frequency, e.g., "15T", 'H' or 'D'.
+    how : `str`, default: "mean"
+        Name of the aggregation, e.g., "mean", "sum", "min" or "max".
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Chunks of resampled data.
+
+    """
+    pending, origin = None, None
+    for chunk in chunks:
+        combined = chunk if pending is None else pd.concat([pending, chunk])
+        if combined.empty:
+            continue
+        if origin is None:
+            origin = combined.index[0].normalize()
+        grouper = pd.Grouper(freq=rule, origin=origin)
+        buckets = combined.groupby(grouper).ngroup().values
+        is_pending = buckets == buckets[-1]
+        # every bucket before the pending one is complete, including empty ones
+        resampled = getattr(combined.resample(rule, origin=origin), how)()
+        if len(resampled) > 1:
+            yield resampled.iloc[:-1]
+        pending = combined[is_pending]
+
+    if pending is not None and not pending.empty:
+        yield getattr(pending.resample(rule, origin=origin), how)()
+
+
+def fill_gaps(chunks: Iterable[pd.DataFrame],
+              freq: str,
+              method: Union[str, None] = None) -> Generator:
+    """
+    Conform a time series to a regular frequency, filling the gaps.
+
+    Streaming equivalent of reindexing the whole time series onto
+    `pandas.date_range(first_timestamp, last_timestamp, freq=freq)`.
+
+    Parameters
+    ----------
+    chunks : `Iterable[pandas.DataFrame]`
+        Consecutive chunks of a time series.
+    freq : `str`
+        Frequency of the regular time index, e.g., 'T'.
+    method : `Union[str, None]`, default: `None`
+        Either `None`, in which case gaps are left missing, or "ffill" to
+        propagate the last valid observation forward.
+
+    Returns
+    -------
+    generator: `Generator`
+
+        Chunks on a regular time index.
+
+    Raises
+    ------
+    ValueError
+        If `method` is not one of `None` or "ffill".
+
+    """
+    if method not in (None, "ffill"):
+        raise ValueError("The 'method' keyword argument must be one of None or 'ffill'.")
+
+    last, next_time = None, None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        start = chunk.index[0] if next_time is None else next_time
+        index = pd.date_range(start, chunk.index[-1], freq=freq)
+        combined = chunk if last is None else pd.concat([last, chunk])
+        yield combined.reindex(index, method=method)
+        if len(index) > 0:
+            next_time = index[-1] + to_offset(freq)
+        last = chunk.iloc[-1:]
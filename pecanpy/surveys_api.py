@@ -5,13 +5,50 @@ returning the results as properly formatted Pandas DataFrame instances.
 @author : davidrpugh
 
 """
-from typing import List, Union
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from pandas.api import types
 import sqlalchemy
 
+from . backends import read_query, read_table
+
+
+# increment whenever the cleaning or harmonization of the survey panel changes
+SURVEY_PANEL_VERSION = 2
+
+# column whose maximum, together with the row count, fingerprints each table
+_SURVEY_ID_COLUMNS = {2011: "dataid", 2012: "response_id", 2013: "dataid", 2014: "dataid"}
+
+# years whose readers clean the raw table; their dtypes define those of the panel
+_CLEANED_SURVEY_YEARS = (2013, 2014)
+
+# answers of the raw 2011 and 2012 tables meaning that the question was not answered
+_SURVEY_MISSING_VALUES = ["", "N/A", "NA", "n/a", "I dont know", "I don't know",
+                          "I dont know/Havent noticed"]
+
+# answers of the raw 2011 and 2012 tables recoded to the values used from 2013
+_SURVEY_VALUE_MAPS = {"number_floors": {"One": 1, "Two": 2, "Three": 3, "Four": 4},
+                      "year_house_constructed": {"1930 or earlier": 1930},
+                      "tv_hours": {"10 or more": 11},
+                      "programmable_thermostat_difficulty": {"Haven't tried": "Havent tried"}}
+
+# answers of the raw 2011 and 2012 tables recoded for columns starting with a prefix
+_SURVEY_PREFIX_VALUE_MAPS = {"residents_": {"None": 0, "5 or more": 5},
+                             "sex_": {"None": 0, "5 or more": 5},
+                             "electronic_devices_": {"None": 0, "5 or more": 5}}
+
+# columns renamed by the 2013 reader
+_SURVEY_2013_COLUMN_RENAMES = {"programmable_thermostat_difficultly": "programmable_thermostat_difficulty"}
+
+_SURVEY_BOOLEAN_VALUES = {"Yes": True, "No": False, "yes": True, "no": False,
+                          "True": True, "False": False}
+
 
 def read_survey_2011_all_participants_table(con: sqlalchemy.engine.Connectable,
                                             schema: str) -> pd.DataFrame:
@@ -23,7 +60,8 @@ def read_survey_2011_all_participants_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2011_all_participants` table/view.
 
@@ -34,7 +72,7 @@ def read_survey_2011_all_participants_table(con: sqlalchemy.engine.Connectable,
         2011 survey data for all participants.
 
     """
-    df = pd.read_sql_table("survey_2011_all_participants", con, schema)
+    df = read_table(con, "survey_2011_all_participants", schema)
     return df
 
 
@@ -48,7 +86,8 @@ def read_survey_2012_all_participants_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2012_all_participants` table/view.
 
@@ -60,8 +99,8 @@ def read_survey_2012_all_participants_table(con: sqlalchemy.engine.Connectable,
 
     """
     datetime_columns = ["start_time", "date_submitted"]
-    df = pd.read_sql_table("survey_2012_all_participants", con, schema,
-                           index_col=["response_id"], parse_dates=datetime_columns)
+    df = read_table(con, "survey_2012_all_participants", schema,
+                    index_col=["response_id"], parse_dates=datetime_columns)
     return df
 
 
@@ -75,7 +114,8 @@ def read_survey_2012_field_descriptions_table(con: sqlalchemy.engine.Connectable
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2012_field_descriptions` table/view.
 
@@ -86,8 +126,8 @@ def read_survey_2012_field_descriptions_table(con: sqlalchemy.engine.Connectable
         2012 survey field descriptions.
 
     """
-    df = pd.read_sql_table("survey_2012_field_descriptions", con, schema,
-                           index_col=["column_name"])
+    df = read_table(con, "survey_2012_field_descriptions", schema,
+                    index_col=["column_name"])
     return df
 
 
@@ -101,7 +141,8 @@ def read_survey_2013_all_participants_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2013_all_participants` table/view.
 
@@ -112,7 +153,7 @@ def read_survey_2013_all_participants_table(con: sqlalchemy.engine.Connectable,
         2013 survey data for all participants.
 
     """
-    df = pd.read_sql_table("survey_2013_all_participants", con, schema)
+    df = read_table(con, "survey_2013_all_participants", schema)
 
     # these variables are encoded as True/False but could also be 1/0.
     # merge the two foundation columns into single categorical columns
@@ -353,7 +394,8 @@ def read_survey_2013_field_descriptions_table(con: sqlalchemy.engine.Connectable
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2013_field_descriptions` table/view.
 
@@ -364,8 +406,8 @@ def read_survey_2013_field_descriptions_table(con: sqlalchemy.engine.Connectable
         2013 survey field descriptions.
 
     """
-    df = pd.read_sql_table("survey_2013_field_descriptions", con, schema,
-                           index_col=["column_name"])
+    df = read_table(con, "survey_2013_field_descriptions", schema,
+                    index_col=["column_name"])
     return df
 
 
@@ -379,7 +421,8 @@ def read_survey_2014_all_participants_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2014_all_participants` table/view.
 
@@ -390,7 +433,7 @@ def read_survey_2014_all_participants_table(con: sqlalchemy.engine.Connectable,
         2014 survey data for all participants.
 
     """
-    df = pd.read_sql_table("survey_2014_all_participants", con, schema)
+    df = read_table(con, "survey_2014_all_participants", schema)
 
     # merge the two foundation columns into single categorical columns
     dtype = types.CategoricalDtype(categories=["Pier and beam", "Slab", "Both"],
@@ -527,7 +570,8 @@ def read_survey_2014_field_descriptions_table(con: sqlalchemy.engine.Connectable
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of schema containing the `survey_2014_field_descriptions` table/view.
 
@@ -538,12 +582,260 @@ def read_survey_2014_field_descriptions_table(con: sqlalchemy.engine.Connectable
         2014 survey field descriptions.
 
     """
-    df = pd.read_sql_table("survey_2014_field_descriptions", con, schema,
-                           index_col=["column_name"])
+    df = read_table(con, "survey_2014_field_descriptions", schema,
+                    index_col=["column_name"])
     df.drop("id", axis=1, inplace=True)
     return df
 
 
+_SURVEY_READERS = {2011: read_survey_2011_all_participants_table,
+                   2012: read_survey_2012_all_participants_table,
+                   2013: read_survey_2013_all_participants_table,
+                   2014: read_survey_2014_all_participants_table}
+
+
+def read_survey_panel(con: sqlalchemy.engine.Connectable,
+                      schema: str,
+                      years: Tuple[int, ...] = (2011, 2012, 2013, 2014),
+                      cache_directory: Union[str, None] = None) -> pd.DataFrame:
+    """
+    Read the survey data for several years into a single harmonized
+    `pandas.DataFrame`.
+
+    Each year is read by its reader and column names are converted to snake
+    case. The raw 2012 columns are renamed to the 2013 columns asking the same
+    question, matching the 2012 and 2013 field descriptions. Columns are then
+    given the dtype of the same column in the cleaned 2013 and 2014 surveys:
+    answers of the raw 2011 and 2012 surveys are recoded (e.g., "Two" floors
+    becomes 2) and values outside the categories of the cleaned years are
+    treated as missing, so ordered categories stay ordered, while "Yes"/"No"
+    answers become the "boolean" dtype. Raw 2011 and 2012 columns without a
+    counterpart in the cleaned years are kept as they are, with snake case
+    names; 2011 columns are only matched by name, as there is no 2011 field
+    descriptions table. A "survey_year" column records the year of each
+    response.
+
+    Parameters
+    ----------
+    con : `sqlalchemy.engine.Connectable`
+        An object which supports execution of SQL constructs. Currently there
+        are two implementations: `sqlalchemy.engine.Connection` and
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
+    schema : `str`
+        Name of schema containing the `survey_<year>_all_participants` tables/views,
+        and the `survey_2012_field_descriptions` and
+        `survey_2013_field_descriptions` tables/views if 2012 is in `years`.
+    years : `Tuple[int, ...]`, default: (2011, 2012, 2013, 2014)
+    cache_directory : `Union[str, None]`, default: `None`
+        If specified, the panel is cached in this directory as a Feather file
+        keyed by a fingerprint of the source tables (row count and maximum id)
+        and of `SURVEY_PANEL_VERSION`. Repeat reads of unchanged tables only
+        query the fingerprint and skip the cleaning entirely.
+
+    Returns
+    -------
+    panel: `pandas.DataFrame`
+
+        Harmonized survey data for all participants in all `years`.
+
+    Raises
+    ------
+    ValueError
+        If `years` contains a year without a survey.
+
+    Notes
+    -----
+    Caching requires `pyarrow`.
+
+    """
+    unknown = set(years) - set(_SURVEY_READERS)
+    if unknown:
+        raise ValueError("No survey for years: {}.".format(", ".join(str(year) for year in sorted(unknown))))
+
+    if cache_directory is not None:
+        fingerprint = _survey_panel_fingerprint(con, schema, years)
+        path = os.path.join(cache_directory, "survey_panel_{}.feather".format(fingerprint))
+        if os.path.exists(path):
+            return pd.read_feather(path)
+
+    renames = _survey_2012_renames(con, schema) if 2012 in years else {}
+    frames = {}
+    for year in years:
+        df = _SURVEY_READERS[year](con, schema)
+        df = df.reset_index(drop=df.index.names == [None])
+        df.columns = [_snake_case(column) for column in df.columns]
+        if year == 2012:
+            df.rename(columns=renames, inplace=True)
+        df.insert(0, "survey_year", year)
+        frames[year] = df
+    panel = _harmonize_survey_frames(frames)
+
+    if cache_directory is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        panel.to_feather(temp_path)
+        os.replace(temp_path, path)  # readers never see a partially written file
+    return panel
+
+
+def _survey_panel_fingerprint(con: sqlalchemy.engine.Connectable,
+                              schema: str,
+                              years: Tuple[int, ...]) -> str:
+    """Hash of the row counts and maximum ids of the survey tables and of the panel version."""
+    template = """SELECT {year} AS survey_year, COUNT(*) AS row_count, MAX({id_column}) AS max_id
+                  FROM {schema}.survey_{year}_all_participants"""
+    query = "\nUNION ALL\n".join(template.format(year=year, id_column=_SURVEY_ID_COLUMNS[year],
+                                                   schema=schema)
+                                   for year in years) + "\nORDER BY survey_year;"
+    df = read_query(con, query)
+    key = {"version": SURVEY_PANEL_VERSION,
+           "schema": schema,
+           "tables": df.astype(str).values.tolist()}
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+
+
+def _survey_2012_renames(con: sqlalchemy.engine.Connectable, schema: str) -> dict:
+    """
+    Map the raw 2012 columns to the 2013 columns whose field description is
+    the same question. Descriptions shared by several columns are ignored.
+
+    """
+    renames = {}
+    descriptions = [_field_descriptions(reader(con, schema))
+                    for reader in (read_survey_2012_field_descriptions_table,
+                                   read_survey_2013_field_descriptions_table)]
+    descriptions[1] = descriptions[1].rename(index=_SURVEY_2013_COLUMN_RENAMES)
+    unique = [d[~d.duplicated(keep=False)] for d in descriptions]
+    columns_2013 = pd.Series(unique[1].index, index=unique[1].values)
+    for column, description in unique[0].items():
+        if description not in columns_2013.index:
+            continue
+        target = columns_2013[description]
+        if target != column and target not in descriptions[0].index:
+            renames[column] = target
+    return renames
+
+
+def _field_descriptions(df: pd.DataFrame) -> pd.Series:
+    """Normalised description of each (snake case) column of a field descriptions table."""
+    if "description" in df:
+        descriptions = df["description"]
+    else:
+        text = df.select_dtypes("object")
+        descriptions = text.iloc[:, 0] if text.shape[1] > 0 else pd.Series(dtype=object)
+    descriptions = (descriptions.dropna()
+                                .astype(str)
+                                .str.lower()
+                                .str.replace(r"[^0-9a-z]+", ' ', regex=True)
+                                .str.strip())
+    descriptions.index = [_snake_case(column) for column in descriptions.index]
+    return descriptions[descriptions != '']
+
+
+def _harmonize_survey_frames(frames: Dict[int, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate survey frames, giving each column of the cleaned years a
+    common dtype and coercing the raw answers of the other years to it.
+
+    """
+    dtypes = {}
+    cleaned = [df for year, df in frames.items() if year in _CLEANED_SURVEY_YEARS]
+    for column in dict.fromkeys(column for df in cleaned for column in df.columns):
+        dtype = _common_dtype([df[column] for df in cleaned if column in df])
+        if dtype is not None:
+            dtypes[column] = dtype
+
+    harmonized = []
+    for year, df in frames.items():
+        df = df.copy()
+        for column in df:
+            if column in dtypes:
+                raw = year not in _CLEANED_SURVEY_YEARS
+                df[column] = _coerce_survey_column(df[column], column, dtypes[column], raw)
+        harmonized.append(df)
+
+    panel = pd.concat(harmonized, ignore_index=True, sort=False)
+    for column in panel:
+        if column in dtypes and not types.is_numeric_dtype(dtypes[column]):
+            panel[column] = panel[column].astype(dtypes[column])
+        elif types.is_object_dtype(panel[column]):
+            values = panel[column].dropna()
+            if values.map(type).nunique() > 1:
+                # columnar formats require a single type per column
+                panel[column] = panel[column].where(panel[column].isnull(),
+                                                    panel[column].astype(str))
+    return panel
+
+
+def _common_dtype(series: List[pd.Series]):
+    """
+    The dtype shared by a column of the cleaned years: the union of the
+    categories of categorical columns (ordered if every year's categories
+    appear in the same order within it), "boolean" for True/False answers and
+    the common numeric dtype for numbers. `None` if the column is left as it is.
+
+    """
+    categoricals = [s.dtype for s in series if isinstance(s.dtype, types.CategoricalDtype)]
+    if categoricals:
+        longest = max(categoricals, key=lambda dtype: len(dtype.categories))
+        categories = list(dict.fromkeys(list(longest.categories) +
+                                        [category for dtype in categoricals
+                                         for category in dtype.categories]))
+        ordered = all(dtype.ordered and _is_subsequence(list(dtype.categories), categories)
+                      for dtype in categoricals)
+        return types.CategoricalDtype(categories, ordered=ordered)
+    values = pd.concat([s.dropna() for s in series])
+    if len(values) > 0 and values.map(lambda v: isinstance(v, (bool, np.bool_))).all():
+        return "boolean"
+    if all(types.is_numeric_dtype(s) and not types.is_bool_dtype(s) for s in series):
+        return np.result_type(*[s.dtype for s in series])
+    return None
+
+
+def _coerce_survey_column(series: pd.Series, column: str, dtype, raw: bool) -> pd.Series:
+    """Coerce a column to the dtype of the panel, recoding the answers of raw years."""
+    if raw:
+        values = _recode_survey_answers(series, column)
+    else:
+        values = series
+    if isinstance(dtype, types.CategoricalDtype):
+        if types.is_numeric_dtype(dtype.categories):
+            values = pd.to_numeric(values, errors="coerce")
+        return values.where(values.isin(dtype.categories)).astype(dtype)
+    elif dtype == "boolean":
+        is_bool = values.map(lambda v: isinstance(v, (bool, np.bool_)))
+        if not raw or is_bool[values.notnull()].all():
+            return values.astype("boolean")
+        elif not is_bool.any():
+            return values.notnull().astype("boolean")  # a ticked box holds the answer's text
+        return values.where(is_bool).astype("boolean")
+    values = pd.to_numeric(values, errors="coerce")
+    return values if values.isnull().any() else values.astype(dtype)
+
+
+def _recode_survey_answers(series: pd.Series, column: str) -> pd.Series:
+    value_map = dict(_SURVEY_BOOLEAN_VALUES)
+    value_map.update(_SURVEY_VALUE_MAPS.get(column, {}))
+    for prefix, prefix_map in _SURVEY_PREFIX_VALUE_MAPS.items():
+        if column.startswith(prefix):
+            value_map.update(prefix_map)
+    values = series.where(~series.isin(_SURVEY_MISSING_VALUES))
+    if types.is_object_dtype(values):
+        values = values.map(lambda v: value_map.get(v.strip(), v.strip()) if isinstance(v, str) else v)
+    return values
+
+
+def _is_subsequence(items: list, sequence: list) -> bool:
+    remaining = iter(sequence)
+    return all(item in remaining for item in items)
+
+
+def _snake_case(name: str) -> str:
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", str(name))
+    return re.sub(r"[^0-9a-zA-Z]+", '_', name).strip('_').lower()
+
+
 def _merge_foundation_columns(row):
     if row.foundation_pier_beam == '' or row.foundation_pier_beam is None:
         value = "Slab" if row.foundation_slab == "Slab" else None
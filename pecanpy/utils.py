@@ -4,11 +4,13 @@ Module contining utility functions.
 @author davidrpugh
 
 """
-from typing import Generator, List, Union
+from typing import List, Tuple, Union
 
 import pandas as pd
 import sqlalchemy
 
+from . backends import read_query, read_table
+
 
 def read_sql_query(con: sqlalchemy.engine.Connectable,
                    sql_str: Union[str, None] = None,
@@ -16,7 +18,9 @@ def read_sql_query(con: sqlalchemy.engine.Connectable,
                    index_col = None,
                    parse_dates = None,
                    params = None,
-                   chunksize: Union[int, None] = None) -> Union[pd.DataFrame, Generator]:
+                   chunksize: Union[int, None] = None,
+                   memory_budget: Union[int, None] = None,
+                   spill_directory: Union[str, None] = None):
     """
     Execute arbitrary SQL Select query against a database, returning results
     in a pandas DataFrame. No data manipulation or munging is performed. Either
@@ -29,7 +33,8 @@ def read_sql_query(con: sqlalchemy.engine.Connectable,
     con = `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     sql_str = `str`
         string holding the select query to execute
     sql_file = `str`
@@ -42,10 +47,18 @@ def read_sql_query(con: sqlalchemy.engine.Connectable,
         see pandas.read_sql_query()
     chunksize: `int`, optional
         see pandas.read_sql_query()
+    memory_budget: `int`, optional
+        maximum number of bytes of results to hold in memory. If used, the size
+        of the results is estimated before they are fetched and a `QueryResult`
+        is returned, streaming (or spilling) the results if they do not fit.
+        Overrides chunksize.
+    spill_directory: `str`, optional
+        directory in which to spill results that do not fit in memory_budget
 
     Returns:
     --------
-    pandas dataframe holding query results, or a generator if chunksize is used
+    pandas dataframe holding query results, or a generator if chunksize is used,
+    or a `QueryResult` if memory_budget is used
     """
 
     # input is either through a SQL string or a file with SQL code
@@ -65,8 +78,18 @@ def read_sql_query(con: sqlalchemy.engine.Connectable,
     except ValueError as e:
       raise ValueError('SQL statement must start with "SELECT"!')
 
-    return pd.read_sql_query(SQL, con, index_col = index_col, parse_dates = parse_dates,
-                             params = params, chunksize = chunksize)
+    if memory_budget is not None:
+      from . results import _read_with_budget
+
+      def read(chunksize):
+        return read_query(con, SQL, index_col = index_col, parse_dates = parse_dates,
+                          params = params, chunksize = chunksize)
+
+      return _read_with_budget(con, SQL, read, memory_budget, spill_directory,
+                               params = params)
+
+    return read_query(con, SQL, index_col = index_col, parse_dates = parse_dates,
+                      params = params, chunksize = chunksize)
 
 
 def create_engine(user_name: str,
@@ -91,7 +114,8 @@ def read_metadata_table(con: sqlalchemy.engine.Connectable,
     con : `sqlalchemy.engine.Connectable`
         An object which supports execution of SQL constructs. Currently there
         are two implementations: `sqlalchemy.engine.Connection` and
-        `sqlalchemy.engine.Engine`.
+        `sqlalchemy.engine.Engine`. A DuckDB connection over local Parquet
+        files (see `connect_parquet`) may be used instead.
     schema : `str`
         Name of a schema containing the `metadata` table/view.
     tz : `str`, default: "US/Central"
@@ -103,7 +127,7 @@ def read_metadata_table(con: sqlalchemy.engine.Connectable,
         Metadata table.
 
     """
-    df = pd.read_sql_table("metadata", con, schema, index_col="dataid")
+    df = read_table(con, "metadata", schema, index_col="dataid")
 
     # Columns with only "yes" and `None` or " " should have type `bool`
     for column in df:
@@ -123,3 +147,38 @@ def read_metadata_table(con: sqlalchemy.engine.Connectable,
             df[column] = df[column].dt.tz_convert(tz)
 
     return df
+
+
+def _time_windows(start_time: Union[pd.Timestamp, str],
+                  end_time: Union[pd.Timestamp, str],
+                  freq: Union[str, None]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Split the half-open interval [start_time, end_time) into consecutive
+    windows of length `freq`. The last window is truncated at `end_time`. If
+    `freq` is `None` a single window covering the whole interval is returned.
+
+    """
+    start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+    if freq is None:
+        return [(start, end)]
+    edges = list(pd.date_range(start, end, freq=freq))
+    if not edges or edges[0] != start:
+        edges.insert(0, start)
+    if edges[-1] != end:
+        edges.append(end)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _set_time_index(df: pd.DataFrame, column: str, tz: str) -> pd.DataFrame:
+    """Convert the UTC timestamps in `column` to `tz` and use them as the index."""
+    df[column] = df[column].dt.tz_convert(tz)
+    df.set_index(column, inplace=True)
+    return df
+
+
+def _to_timestamp(value: Union[pd.Timestamp, str], tz: str) -> pd.Timestamp:
+    """Convert `value` to a timestamp in `tz`, treating naive values as local to `tz`."""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize(tz)
+    return timestamp.tz_convert(tz)
@@ -0,0 +1,36 @@
+"""
+Check that chunked reads from DuckDB are not affected by other queries
+executed on the same connection.
+
+@author : davidrpugh
+
+"""
+import pandas as pd
+import pytest
+
+from pecanpy.backends import read_query
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("""CREATE TABLE readings AS
+                   SELECT i AS dataid, i * 1.5 AS use FROM range(1440) AS r(i);""")
+    return con
+
+
+def test_chunks_survive_other_queries(con):
+    chunks = read_query(con, "SELECT * FROM readings ORDER BY dataid;", chunksize=500)
+    first = next(chunks)
+    read_query(con, "SELECT COUNT(*) FROM readings;")
+    result = pd.concat([first] + list(chunks), ignore_index=True)
+    expected = read_query(con, "SELECT * FROM readings ORDER BY dataid;")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_chunked_query_is_executed_lazily(con):
+    chunks = read_query(con, "SELECT * FROM missing;", chunksize=500)
+    with pytest.raises(duckdb.Error):
+        next(chunks)
@@ -0,0 +1,59 @@
+"""
+Check that concurrent requests are coalesced into as few queries as possible
+and that disjoint ranges are fetched concurrently.
+
+@author : davidrpugh
+
+"""
+from concurrent import futures
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from pecanpy.coalescing import RequestCoalescer
+
+
+INDEX = pd.date_range("2018-01-01", periods=48, freq='h', tz="US/Central")
+
+
+def _fetcher(delay):
+    calls, lock = [], threading.Lock()
+
+    def fetch(start, end):
+        with lock:
+            calls.append((start, end))
+        time.sleep(delay)
+        df = pd.DataFrame({"use": np.arange(len(INDEX), dtype=float)}, index=INDEX)
+        return df[(df.index >= start) & (df.index < end)]
+
+    return fetch, calls
+
+
+def _read_concurrently(coalescer, fetch, ranges):
+    with futures.ThreadPoolExecutor(len(ranges)) as executor:
+        results = [executor.submit(coalescer._read, ("key",), fetch, INDEX[i], INDEX[j])
+                   for i, j in ranges]
+        return [result.result() for result in results]
+
+
+def test_overlapping_requests_share_a_query():
+    fetch, calls = _fetcher(0.05)
+    ranges = [(0, 10), (5, 20), (20, 30)]
+    results = _read_concurrently(RequestCoalescer(linger=0.1), fetch, ranges)
+    assert calls == [(INDEX[0], INDEX[30])]
+    for (i, j), df in zip(ranges, results):
+        assert df.index.equals(INDEX[i:j])
+
+
+def test_disjoint_requests_are_fetched_concurrently():
+    fetch, calls = _fetcher(0.5)
+    ranges = [(0, 10), (20, 30), (40, 45)]
+    began = time.perf_counter()
+    results = _read_concurrently(RequestCoalescer(linger=0.1), fetch, ranges)
+    elapsed = time.perf_counter() - began
+    assert len(calls) == 3
+    assert elapsed < 1.0
+    for (i, j), df in zip(ranges, results):
+        assert df.index.equals(INDEX[i:j])
@@ -0,0 +1,47 @@
+"""
+Check that reads resume after the connection drops mid-stream.
+
+@author : davidrpugh
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from pecanpy import electricity_egauge_api
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine("sqlite:///{}".format(tmp_path / "dp.sqlite"))
+    minutes = pd.date_range("2018-01-01", periods=1440, freq="min", tz="UTC")
+    df = pd.DataFrame({"dataid": 1,
+                       "localminute": minutes.strftime("%Y-%m-%d %H:%M:%S+00:00"),
+                       "use": np.arange(len(minutes), dtype=float)})
+    df.to_sql("electricity_egauge_minutes", engine, index=False)
+    return engine
+
+
+def test_resume_after_connection_drops(engine, monkeypatch):
+    with engine.connect() as conn:
+        expected = electricity_egauge_api.read_electricity_egauge_query(
+            conn, "main", 1, "2018-01-01", "2018-01-02")
+
+        read_query, calls = electricity_egauge_api.read_query, []
+
+        def drop_mid_stream(con, query, **kwargs):
+            calls.append(query)
+            for i, chunk in enumerate(read_query(con, query, **kwargs)):
+                if len(calls) == 1 and i == 2:
+                    con.invalidate()
+                    raise sqlalchemy.exc.OperationalError(query, {}, Exception("dropped"))
+                yield chunk
+
+        monkeypatch.setattr(electricity_egauge_api, "read_query", drop_mid_stream)
+        monkeypatch.setattr(electricity_egauge_api, "_RESUMABLE_CHUNKSIZE", 100)
+        result = electricity_egauge_api.read_electricity_egauge_query(
+            conn, "main", 1, "2018-01-01", "2018-01-02", retries=1, backoff=0.0)
+
+    assert len(calls) == 2
+    pd.testing.assert_frame_equal(result, expected)
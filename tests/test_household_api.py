@@ -0,0 +1,54 @@
+"""
+Check that household utilities are aligned on a common time index that
+matches resampling in pandas, including across the end of daylight saving
+time.
+
+@author : davidrpugh
+
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pecanpy.household_api import read_household_utilities_query
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def con():
+    con = duckdb.connect()
+    con.execute("SET TimeZone='UTC';")
+    con.execute("CREATE SCHEMA dp;")
+    con.execute("""CREATE TABLE dp.electricity_egauge_minutes AS
+                   SELECT 1 AS dataid,
+                     TIMESTAMPTZ '2019-11-02 00:00:00+00' + to_minutes(CAST(i AS INTEGER)) AS localminute,
+                     1.0 + i % 7 AS use
+                   FROM range(4 * 1440) AS r(i);""")
+    con.execute("""CREATE VIEW dp.electricity_egauge_15min AS
+                   SELECT dataid, localminute AS local_15min, use FROM dp.electricity_egauge_minutes;""")
+    con.execute("""CREATE VIEW dp.electricity_egauge_hours AS
+                   SELECT dataid, localminute AS localhour, use FROM dp.electricity_egauge_minutes;""")
+    con.execute("""CREATE TABLE dp.gas_ert AS
+                   SELECT 1 AS dataid,
+                     TIMESTAMPTZ '2019-11-02 00:00:00+00' + to_minutes(CAST(15 * i AS INTEGER)) AS readtime,
+                     i * 1.0 AS meter_value
+                   FROM range(4 * 96) AS r(i);""")
+    return con
+
+
+@pytest.mark.parametrize("freq", ["min", "15min", "30min", 'h', 'D'])
+def test_utilities_across_end_of_daylight_saving_time(con, freq):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        df = read_household_utilities_query(con, "dp", [1], "2019-11-03", "2019-11-04",
+                                            utilities=("electricity", "gas"), freq=freq)
+    minutes = pd.date_range("2019-11-02", periods=4 * 1440, freq="min", tz="UTC")
+    use = pd.Series(1.0 + np.arange(len(minutes)) % 7, index=minutes.tz_convert("US/Central"))
+    expected = use["2019-11-03":"2019-11-03"].resample(freq).mean()
+    result = df.loc[1, "electricity_use"]
+    assert result.index.equals(expected.index)
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy())
+    assert df["gas"].sum() == 25 * 4  # one unit per 15 minute reading over 25 hours
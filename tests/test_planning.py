@@ -0,0 +1,32 @@
+"""
+Check the row estimates used to size reads.
+
+@author : davidrpugh
+
+"""
+import pytest
+
+from pecanpy.planning import AdaptiveWindowPlanner, estimate_query_rows
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("""CREATE TABLE readings AS
+                   SELECT i AS dataid, i * 1.5 AS use, i * 2.5 AS car1
+                   FROM range(4320) AS r(i);""")
+    return con
+
+
+@pytest.mark.parametrize("upper, expected", [(10, 10), (4320, 4320), (0, 0)])
+def test_estimate_query_rows_applies_predicates(con, upper, expected):
+    query = "SELECT * FROM readings WHERE dataid < {} ORDER BY dataid;".format(upper)
+    rows, width = estimate_query_rows(con, query)
+    assert rows == expected
+    assert width == (None if expected == 0 else 24)
+
+
+def test_planner_default_window_is_one_hour():
+    assert AdaptiveWindowPlanner().min_window.total_seconds() == 3600
@@ -0,0 +1,44 @@
+"""
+Check that queries answered from a rollup pyramid match resampling the data
+they were built from.
+
+@author : davidrpugh
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pecanpy.pyramid import build_rollup_pyramid, read_rollup_pyramid
+
+
+START, END = "2019-10-07", "2019-12-30"
+
+
+@pytest.fixture(scope="module")
+def df():
+    index = pd.date_range("2019-10-01", "2020-01-01", freq="min", tz="US/Central",
+                          inclusive="left")
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"use": rng.random(len(index))}, index=index)
+
+
+@pytest.fixture(scope="module")
+def directory(df, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("pyramid"))
+    build_rollup_pyramid(df, directory, 1)
+    return directory
+
+
+@pytest.mark.parametrize("freq", ["15min", "4h", 'D', "7D", "14D", 'W', "W-MON", "MS"])
+@pytest.mark.parametrize("agg", ["sum", "mean", "max", "count"])
+def test_read_rollup_pyramid(df, directory, freq, agg):
+    result = read_rollup_pyramid(directory, 1, START, END, freq, agg)
+    data = df[(df.index >= pd.Timestamp(START, tz="US/Central")) &
+              (df.index < pd.Timestamp(END, tz="US/Central"))]
+    expected = getattr(data.resample(freq), agg)()
+    # buckets straddling the end of the range are read whole from the pyramid
+    common = result.index.intersection(expected.index)
+    assert len(common) >= len(expected) - 1
+    pd.testing.assert_frame_equal(result.loc[common], expected.loc[common],
+                                  check_dtype=False, check_freq=False)
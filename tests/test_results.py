@@ -0,0 +1,51 @@
+"""
+Check that reads executed within a memory budget on DuckDB only hold results
+that fit within the budget in memory.
+
+@author : davidrpugh
+
+"""
+import pandas as pd
+import pytest
+
+from pecanpy import read_electricity_egauge_query
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def con():
+    con = duckdb.connect()
+    con.execute("SET TimeZone='UTC';")
+    con.execute("CREATE SCHEMA dp;")
+    con.execute("""CREATE TABLE dp.electricity_egauge_minutes AS
+                   SELECT 1 AS dataid,
+                     TIMESTAMPTZ '2018-01-01 00:00:00+00' + to_minutes(CAST(i AS INTEGER)) AS localminute,
+                     i * 1.0 AS use, i * 0.5 AS grid
+                   FROM range(3 * 1440) AS r(i);""")
+    return con
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_result_larger_than_budget_is_not_held_in_memory(con, tmp_path, spill):
+    expected = read_electricity_egauge_query(con, "dp", 1, "2018-01-01", "2018-01-04")
+    size = expected.memory_usage(deep=True).sum()
+    budget = size // 2
+    spill_directory = str(tmp_path) if spill else None
+    with read_electricity_egauge_query(con, "dp", 1, "2018-01-01", "2018-01-04",
+                                       memory_budget=budget,
+                                       spill_directory=spill_directory) as result:
+        assert result.mode == ("spill" if spill else "chunks")
+        assert result.estimated_bytes > budget
+        chunks = list(result.iter_chunks())
+    assert all(chunk.memory_usage(deep=True).sum() <= budget for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected, check_freq=False)
+
+
+def test_result_within_budget_is_held_in_memory(con):
+    expected = read_electricity_egauge_query(con, "dp", 1, "2018-01-01 00:00", "2018-01-01 00:10")
+    with read_electricity_egauge_query(con, "dp", 1, "2018-01-01 00:00", "2018-01-01 00:10",
+                                       memory_budget=100000) as result:
+        assert result.mode == "memory"
+        assert result.estimated_bytes == expected.memory_usage(deep=True).sum()
+        pd.testing.assert_frame_equal(result.to_frame(), expected)
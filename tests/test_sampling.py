@@ -0,0 +1,68 @@
+"""
+Check that samples of households and days are reproducible, depend on the
+seed and select whole local days.
+
+@author : davidrpugh
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pecanpy import sampling
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def con():
+    con = duckdb.connect()
+    con.execute("SET TimeZone='UTC';")
+    con.execute("CREATE SCHEMA dp;")
+    con.execute("""CREATE TABLE dp.metadata AS
+                   SELECT i + 1 AS dataid, CASE WHEN i % 3 = 0 THEN 'Austin' ELSE 'Boulder' END AS city
+                   FROM range(10000) AS r(i);""")
+    con.execute("""CREATE TABLE dp.gas_ert AS
+                   SELECT 1 + i % 4 AS dataid,
+                     TIMESTAMPTZ '2019-10-01 05:00:00+00' + to_minutes(CAST(60 * (i // 4) AS INTEGER)) AS readtime,
+                     i * 1.0 AS meter_value
+                   FROM range(4 * 24 * 61) AS r(i);""")
+    return con
+
+
+def test_seeds_draw_different_households(con):
+    samples = [set(sampling.read_sampled_dataids(con, "dp", 0.1, seed=seed)) for seed in range(3)]
+    assert [len(sample) for sample in samples] == [1000, 1000, 1000]
+    for i in range(3):
+        for j in range(i + 1, 3):
+            assert len(samples[i] & samples[j]) < 200  # about 100 if independent
+    assert samples[0] == set(sampling.read_sampled_dataids(con, "dp", 0.1, seed=0))
+
+
+def test_stratified_sample(con):
+    dataids = sampling.read_sampled_dataids(con, "dp", 0.1, strata=["city"], seed=1)
+    assert len(dataids) == 334 + 667
+
+
+@pytest.mark.parametrize("day_fraction, day_step", [(0.25, None), (None, 7), (0.5, 2)])
+def test_day_sample_selects_whole_local_days(con, day_fraction, day_step):
+    df = sampling.read_gas_ert_sample(con, "dp", "2019-10-01", "2019-12-01",
+                                      dataids=[1, 2], day_fraction=day_fraction,
+                                      day_step=day_step, seed=3)
+    times = df.index.get_level_values("readtime")
+    days = pd.Series(times.normalize()).value_counts()
+    # the day daylight saving time ends has 25 hours
+    hours = np.where(days.index == pd.Timestamp("2019-11-03", tz="US/Central"), 25, 24)
+    assert (days.to_numpy() == 2 * hours).all()
+    day_numbers = (days.index.tz_localize(None) - pd.Timestamp(0)).days
+    if day_step is not None:
+        assert (day_numbers % day_step == 3 % day_step).all()
+    if day_fraction is not None and day_step is None:
+        assert len(days) == int(np.ceil(day_fraction * 61))
+
+
+def test_household_fraction_without_dataids(con):
+    df = sampling.read_gas_ert_sample(con, "dp", "2019-10-01", "2019-10-02",
+                                      household_fraction=0.001, seed=0)
+    expected = sampling.read_sampled_dataids(con, "dp", 0.001, seed=0)
+    assert set(df.index.get_level_values("dataid")) <= set(expected)
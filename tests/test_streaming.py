@@ -0,0 +1,84 @@
+"""
+Check that each streaming operator gives the same result on a chunked time
+series as the equivalent pandas operation on the whole series.
+
+@author : davidrpugh
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pecanpy import streaming
+
+
+CHUNKSIZES = [1, 7, 100, 10000]
+
+
+@pytest.fixture
+def df():
+    """Minute data with gaps, including gaps spanning whole hours."""
+    rng = np.random.default_rng(42)
+    index = pd.date_range("2018-01-01", periods=2000, freq="min", tz="US/Central")
+    keep = rng.random(len(index)) > 0.3
+    keep[300:500] = False
+    index = index[keep]
+    return pd.DataFrame({"meter_value": np.cumsum(rng.random(len(index))),
+                         "use": rng.random(len(index))},
+                        index=index)
+
+
+def _chunks(df, chunksize):
+    return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+
+
+def _concat(chunks):
+    return pd.concat(list(chunks))
+
+
+@pytest.mark.parametrize("chunksize", CHUNKSIZES)
+@pytest.mark.parametrize("periods", [1, 3])
+def test_diff(df, chunksize, periods):
+    result = _concat(streaming.diff(_chunks(df, chunksize), periods))
+    pd.testing.assert_frame_equal(result, df.diff(periods))
+
+
+@pytest.mark.parametrize("chunksize", CHUNKSIZES)
+def test_consumption_from_cumulative(df, chunksize):
+    result = _concat(streaming.consumption_from_cumulative(_chunks(df, chunksize)))
+    expected = df[["meter_value"]].diff().rename(columns={"meter_value": "consumption"})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("chunksize", CHUNKSIZES)
+@pytest.mark.parametrize("window", [5, "15min"])
+@pytest.mark.parametrize("how", ["mean", "sum", "max"])
+def test_rolling(df, chunksize, window, how):
+    result = _concat(streaming.rolling(_chunks(df, chunksize), window, how))
+    expected = getattr(df.rolling(window), how)()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("chunksize", CHUNKSIZES)
+@pytest.mark.parametrize("rule", ["15min", "h"])
+@pytest.mark.parametrize("how", ["mean", "sum", "count"])
+def test_resample(df, chunksize, rule, how):
+    result = _concat(streaming.resample(_chunks(df, chunksize), rule, how))
+    expected = getattr(df.resample(rule), how)()
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
+
+
+def test_resample_emits_empty_buckets():
+    index = pd.to_datetime(["2018-01-01 09:10", "2018-01-01 09:20", "2018-01-01 12:05"])
+    df = pd.DataFrame({"use": [1.0, 2.0, 3.0]}, index=index)
+    result = _concat(streaming.resample(_chunks(df, 2), 'h', "sum"))
+    pd.testing.assert_frame_equal(result, df.resample('h').sum(), check_freq=False)
+
+
+@pytest.mark.parametrize("chunksize", CHUNKSIZES)
+@pytest.mark.parametrize("method", [None, "ffill"])
+def test_fill_gaps(df, chunksize, method):
+    result = _concat(streaming.fill_gaps(_chunks(df, chunksize), "min", method))
+    index = pd.date_range(df.index[0], df.index[-1], freq="min")
+    expected = df.reindex(index, method=method)
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
@@ -0,0 +1,75 @@
+"""
+Check that the survey panel harmonizes the raw 2012 answers with the cleaned
+2013 and 2014 surveys.
+
+@author : davidrpugh
+
+"""
+import pandas as pd
+import pytest
+
+from pecanpy.surveys_api import read_survey_panel
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE SCHEMA dp;")
+    tables = {
+        "survey_2012_all_participants": pd.DataFrame({
+            "response_id": [1, 2, 3],
+            "start_time": pd.to_datetime(["2012-05-01", "2012-05-02", "2012-05-03"]),
+            "date_submitted": pd.to_datetime(["2012-05-01", "2012-05-02", "2012-05-03"]),
+            "dataid": [10, 11, 12],
+            "HowManyFloors": ["Two", "One", "Five"],
+            "PrimaryHome": ["Yes", "No", None],
+            "OwnPV": ["Yes", "No", "Yes"],
+            "Comments": ["none", None, "drafty"]}),
+        "survey_2012_field_descriptions": pd.DataFrame({
+            "column_name": ["HowManyFloors", "PrimaryHome", "OwnPV", "Comments"],
+            "description": ["How many floors does your home have?",
+                            "Is this your primary residence?",
+                            "Do you own a solar PV system?",
+                            "Any other comments?"]}),
+        "survey_2013_all_participants": pd.DataFrame({
+            "dataid": [20, 21],
+            "foundation_pier_beam": ["Pier and beam", None],
+            "foundation_slab": [None, "Slab"],
+            "number_floors": ["Three", "One"],
+            "primary_residence": ["Yes", "No"]}),
+        "survey_2013_field_descriptions": pd.DataFrame({
+            "column_name": ["number_floors", "primary_residence"],
+            "description": ["How many floors does your home have",
+                            "Is this your primary residence"]}),
+        "survey_2014_all_participants": pd.DataFrame({
+            "dataid": [30, 31],
+            "status": ["Complete", "Partial"],
+            "foundation_pier_beam": ['', "Pier and beam"],
+            "foundation_slab": ["Slab", ''],
+            "pv_system_own": ["Yes", "No"]}),
+    }
+    for name, df in tables.items():
+        con.register("frame", df)
+        con.execute("CREATE TABLE dp.{} AS SELECT * FROM frame;".format(name))
+        con.unregister("frame")
+    return con
+
+
+def test_raw_answers_are_harmonized(con):
+    panel = read_survey_panel(con, "dp", years=(2012, 2013, 2014))
+    panel = panel.set_index(["survey_year", "dataid"])
+
+    floors = panel["number_floors"]
+    assert floors.dtype == pd.CategoricalDtype([1, 2, 3, 4], ordered=True)
+    assert floors.loc[2012].tolist()[:2] == [2, 1]
+    assert pd.isnull(floors.loc[(2012, 12)])  # "Five" is not an answer of 2013
+    assert floors.loc[2013].tolist() == [3, 1]
+
+    assert panel["primary_residence"].dtype == "boolean"
+    assert panel["primary_residence"].tolist()[:5] == [True, False, pd.NA, True, False]
+    assert panel["pv_system_own"].dtype == "boolean"
+    assert panel["own_pv"].dtype == object  # no counterpart in 2013, kept as it is
+    assert panel["comments"].loc[(2012, 12)] == "drafty"
+    assert "how_many_floors" not in panel